@@ -19,6 +19,7 @@ from ..conversion.attr_conversion import h5_to_zarr_attr
 from ..conversion.reformat_json import reformat_json
 from ..conversion.h5_filters_to_codecs import h5_filters_to_codecs
 from ..conversion.create_zarr_dataset_from_h5_data import create_zarr_dataset_from_h5_data
+from ..conversion._util import _read_h5_dataset
 from ..LindiH5pyFile.LindiReferenceFileSystemStore import LindiReferenceFileSystemStore
 from ..LocalCache.LocalCache import ChunkTooLargeError, LocalCache
 from ..LindiRemfile.LindiRemfile import LindiRemfile
@@ -808,6 +809,16 @@ class LindiH5ZarrStore(Store):
 
 
 class InlineArray:
+    # One of these is kept for every dataset that is accessed, so we avoid
+    # the per-instance __dict__
+    __slots__ = (
+        "_additional_zarr_attributes",
+        "_is_inline",
+        "_zarray_bytes",
+        "_chunk_fname",
+        "_chunk_bytes",
+    )
+
     def __init__(self, h5_dataset: Union[h5py.Dataset, SplitDatasetH5Item]):
         self._additional_zarr_attributes = {}
         if h5_dataset.shape == ():
@@ -852,7 +863,7 @@ class InlineArray:
                 h5_shape=h5_dataset.shape,
                 h5_dtype=h5_dataset.dtype,
                 h5f=h5_item.file,
-                h5_data=h5_item[...]
+                h5_data=_read_h5_dataset(h5_item)
             )
             self._zarray_bytes = reformat_json(memory_store['X/.zarray'])
             if not size_is_zero:
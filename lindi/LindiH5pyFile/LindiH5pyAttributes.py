@@ -3,13 +3,13 @@ from ..conversion.attr_conversion import zarr_to_h5_attr
 from ..conversion.nan_inf_ninf import decode_nan_inf_ninf
 from .writers.LindiH5pyAttributesWriter import LindiH5pyAttributesWriter
 
-_special_attribute_keys = [
+_special_attribute_keys = frozenset({
     "_SCALAR",
     "_COMPOUND_DTYPE",
     "_REFERENCE",
     "_EXTERNAL_ARRAY_LINK",
     "_SOFT_LINK",
-]
+})
 
 
 class LindiH5pyAttributes:
@@ -52,24 +52,27 @@ class LindiH5pyAttributes:
         assert self._writer is not None
         self._writer.__setitem__(key, value)
 
+    def update(self, *args, **kwargs):
+        if self._readonly:
+            raise ValueError("Cannot set items on read-only object")
+        assert self._writer is not None
+        self._writer.update(dict(*args, **kwargs))
+
     def __delitem__(self, key):
         raise KeyError("Cannot delete attributes on read-only object")
 
     def __iter__(self):
         # Do not return special zarr attributes during iteration
-        for k in self._attrs:
-            if k not in _special_attribute_keys:
-                yield k
+        return filter(lambda k: k not in _special_attribute_keys, self._attrs)
 
     def items(self):
         for k in self:
             yield k, self[k]
 
     def __len__(self):
-        ct = 0
-        for _ in self:
-            ct += 1
-        return ct
+        # Rather than iterating over all the attributes, subtract the number
+        # of special zarr attributes that are present
+        return len(self._attrs) - sum(1 for k in _special_attribute_keys if k in self._attrs)
 
     def __repr__(self):
         return repr(self._attrs)
@@ -1,4 +1,6 @@
-from typing import TYPE_CHECKING, Any, Dict
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Union
+from collections import OrderedDict
+import weakref
 import numpy as np
 import h5py
 import zarr
@@ -14,18 +16,36 @@ if TYPE_CHECKING:
     from .LindiH5pyFile import LindiH5pyFile  # pragma: no cover
 
 
-# This is a global list of external hdf5 clients, which are used by
+# This is a global LRU cache of external hdf5 clients, which are used by
 # possibly multiple LindiH5pyFile objects. The key is the URL of the
-# external hdf5 file, and the value is the h5py.File object.
-# TODO: figure out how to close these clients
-_external_hdf5_clients: Dict[str, h5py.File] = {}
+# external hdf5 file together with the directory of the local cache (None if
+# there is no local cache), and the value is the h5py.File object along with
+# the underlying file object. When the cache is full, the least recently used
+# client is closed.
+_max_external_hdf5_clients = 16
+_external_hdf5_clients: "OrderedDict[Tuple[str, Union[str, None]], Tuple[h5py.File, Any]]" = OrderedDict()
+
+# This is a global LRU cache of the values of compound dataset fields that
+# have been read in full. The key is the id of the dataset together with the
+# index of the field, and the value is a weak reference to the dataset along
+# with the values of the field. The weak reference guards against the id
+# being reused by another dataset. When the total size of the cached values
+# goes over the limit, the least recently used values are dropped, and the
+# values of a dataset are dropped when the dataset is garbage collected. The
+# cached values are read-only, so the arrays returned to callers are copies.
+_max_compound_columns_nbytes = 100 * 1024 * 1024
+_compound_columns: "OrderedDict[Tuple[int, int], Tuple[weakref.ref, np.ndarray]]" = OrderedDict()
+_compound_columns_nbytes = 0
+
+# The numpy dtype used for reference fields of compound datasets
+_H5_REF_DTYPE = h5py.special_dtype(ref=h5py.Reference)
 
 
 class LindiH5pyDataset(h5py.Dataset):
     def __init__(self, _zarr_array: zarr.Array, _file: "LindiH5pyFile"):
         self._zarr_array = _zarr_array
         self._file = _file
-        self._readonly = _file.mode not in ['r+']
+        self._readonly = _file._readonly
 
         # see comment in LindiH5pyGroup
         self._id = f'{id(self._file)}/{self._zarr_array.name}'
@@ -39,7 +59,7 @@ class LindiH5pyDataset(h5py.Dataset):
             # where dtype == "<REFERENCE>" if it represents an HDF5 reference
             for i in range(len(compound_dtype_obj)):
                 if compound_dtype_obj[i][1] == '<REFERENCE>':
-                    compound_dtype_obj[i][1] = h5py.special_dtype(ref=h5py.Reference)
+                    compound_dtype_obj[i][1] = _H5_REF_DTYPE
             # If we have a compound dtype, then create the numpy dtype
             self._compound_dtype = np.dtype(
                 [
@@ -50,12 +70,53 @@ class LindiH5pyDataset(h5py.Dataset):
                     for i in range(len(compound_dtype_obj))
                 ]
             )
+            assert self._compound_dtype.names is not None
+            # Precompute the lookups needed when selecting a field by name
+            self._compound_field_index: Union[Dict[str, int], None] = {
+                name: i for i, name in enumerate(self._compound_dtype.names)
+            }
+            self._compound_field_dtypes: Union[List[Any], None] = [
+                h5py.Reference if self._compound_dtype[i] == 'object' else np.dtype(self._compound_dtype[i])
+                for i in range(len(self._compound_dtype.names))
+            ]
         else:
             self._compound_dtype = None
+            self._compound_field_index = None
+            self._compound_field_dtypes = None
+        # This is set when a field of the compound dataset is first cached
+        self._compound_columns_finalizer: Union[weakref.finalize, None] = None
 
         # Check whether this is a scalar dataset
         self._is_scalar = self._zarr_array.attrs.get("_SCALAR", False)
 
+        # These do not change for the lifetime of the dataset, so we look them
+        # up once rather than on every property access
+        self._shape = () if self._is_scalar else self._zarr_array.shape
+        self._chunks = self._zarr_array.chunks
+        self._fletcher32 = any(
+            f.__class__.__name__ == 'Fletcher32' for f in (self._zarr_array.filters or ())
+        )
+
+        # Check whether this dataset links to a dataset in an external hdf5
+        # file, so that we don't need to check the attributes on every read
+        external_array_link = self._zarr_array.attrs.get("_EXTERNAL_ARRAY_LINK", None)
+        self._external_array_link: Union[dict, None] = (
+            external_array_link if isinstance(external_array_link, dict) else None
+        )
+
+        # Only object arrays can contain references, so for all other arrays
+        # we can skip decoding references when reading
+        self._has_refs = self._zarr_array.dtype.kind == 'O'
+
+        # This is set on the first access of the dtype property
+        self._cached_dtype: Union[np.dtype, None] = None
+
+        # This is set on the first access of the attrs property
+        self._cached_attrs: Union[LindiH5pyAttributes, None] = None
+
+        # For read-only scalar datasets, this is set on the first read
+        self._cached_scalar_value: Any = None
+
         # The self._write object handles all the writing operations
         from .writers.LindiH5pyDatasetWriter import LindiH5pyDatasetWriter  # avoid circular import
 
@@ -71,9 +132,7 @@ class LindiH5pyDataset(h5py.Dataset):
 
     @property
     def shape(self):  # type: ignore
-        if self._is_scalar:
-            return ()
-        return self._zarr_array.shape
+        return self._shape
 
     @property
     def size(self):
@@ -85,6 +144,13 @@ class LindiH5pyDataset(h5py.Dataset):
     def dtype(self):
         if self._compound_dtype is not None:
             return self._compound_dtype
+        # The dtype of the zarr array does not change, so we only need to
+        # compute this once
+        if self._cached_dtype is None:
+            self._cached_dtype = self._compute_dtype()
+        return self._cached_dtype
+
+    def _compute_dtype(self):
         ret = self._zarr_array.dtype
         if ret.kind == 'O':
             if not ret.metadata:
@@ -145,18 +211,19 @@ class LindiH5pyDataset(h5py.Dataset):
 
     @property
     def attrs(self):  # type: ignore
-        return LindiH5pyAttributes(self._zarr_array.attrs, readonly=self._file.mode == 'r')
+        # The mode of the file does not change, so the same wrapper can be
+        # returned every time
+        if self._cached_attrs is None:
+            self._cached_attrs = LindiH5pyAttributes(self._zarr_array.attrs, readonly=self._readonly)
+        return self._cached_attrs
 
     @property
     def fletcher32(self):
-        for f in self._zarr_array.filters:
-            if f.__class__.__name__ == 'Fletcher32':
-                return True
-        return False
+        return self._fletcher32
 
     @property
     def chunks(self):
-        return self._zarr_array.chunks
+        return self._chunks
 
     def __repr__(self):  # type: ignore
         return f"<{self.__class__.__name__}: {self.name}>"
@@ -167,12 +234,21 @@ class LindiH5pyDataset(h5py.Dataset):
     def __getitem__(self, args, new_dtype=None):
         if new_dtype is not None:
             raise Exception("new_dtype is not supported for zarr.Array")
-        return self._get_item_for_zarr(self._zarr_array, args)
+        is_scalar_read = self._is_scalar and isinstance(args, tuple) and len(args) == 0
+        if is_scalar_read and self._cached_scalar_value is not None:
+            return self._cached_scalar_value
+        ret = self._get_item_for_zarr(self._zarr_array, args)
+        if is_scalar_read and self._readonly and self._external_array_link is None:
+            if isinstance(ret, (np.generic, str, bytes, int, float)):
+                # Scalar datasets are often read many times (e.g., NWB metadata
+                # fields), so we keep immutable values for subsequent reads
+                self._cached_scalar_value = ret
+        return ret
 
     def _get_item_for_zarr(self, zarr_array: zarr.Array, selection: Any):
         # First check whether this is an external array link
-        external_array_link = zarr_array.attrs.get("_EXTERNAL_ARRAY_LINK", None)
-        if external_array_link and isinstance(external_array_link, dict):
+        external_array_link = self._external_array_link
+        if external_array_link:
             link_type = external_array_link.get("link_type", None)
             if link_type == 'hdf5_dataset':
                 url = external_array_link.get("url", None)
@@ -187,16 +263,17 @@ class LindiH5pyDataset(h5py.Dataset):
             # In this case we index into the compound dtype using the name of the field
             # For example, if the dtype is [('x', 'f4'), ('y', 'f4')], then we can do
             # dataset['x'][0] to get the first x value
-            assert self._compound_dtype.names is not None
+            assert self._compound_field_index is not None
+            assert self._compound_field_dtypes is not None
             if isinstance(selection, str):
                 # Find the index of this field in the compound dtype
-                ind = self._compound_dtype.names.index(selection)
+                ind = self._compound_field_index.get(selection, None)
+                if ind is None:
+                    raise ValueError(
+                        f"Field {selection} not found in compound dataset {self.name}"
+                    )
                 # Get the dtype of this field
-                dt = self._compound_dtype[ind]
-                if dt == 'object':
-                    dtype = h5py.Reference
-                else:
-                    dtype = np.dtype(dt)
+                dtype = self._compound_field_dtypes[ind]
                 # Return a new object that can be sliced further
                 # It's important that the return type is Any here, because otherwise we get linter problems
                 ret = LindiH5pyDatasetCompoundFieldSelection(
@@ -213,19 +290,62 @@ class LindiH5pyDataset(h5py.Dataset):
             # make sure selection is ()
             if selection != ():
                 raise TypeError(f'Cannot slice a scalar dataset with {selection}')
-            # For some reason, with the newest version of zarr (2.18.0) we need to use [:][0] rather than just [0].
+            # For some reason, with the newest version of zarr (2.18.0) we need to use [0:1][0] rather than just [0].
             # Otherwise we get an error "ValueError: buffer source array is read-only"
-            return zarr_array[:][0]
-        return decode_references(zarr_array[selection])
+            # Slicing [0:1] rather than [:] means only the first element is read
+            return zarr_array[0:1][0]
+        ret = zarr_array[selection]
+        if not self._has_refs:
+            return ret
+        return decode_references(ret)
+
+    def _get_compound_column(self, ind: int) -> Union[np.ndarray, None]:
+        """Return the cached values of a field of the compound dataset, or
+        None if they have not been read yet."""
+        key = (id(self), ind)
+        entry = _compound_columns.get(key, None)
+        if entry is None or entry[0]() is not self:
+            return None
+        _compound_columns.move_to_end(key)
+        return entry[1]
+
+    def _set_compound_column(self, ind: int, column: np.ndarray):
+        """Add the values of a field of the compound dataset to the cache,
+        dropping the least recently used values if the cache is too large."""
+        global _compound_columns_nbytes
+        if column.nbytes > _max_compound_columns_nbytes:
+            return
+        assert self._compound_field_dtypes is not None
+        if self._compound_columns_finalizer is None:
+            self._compound_columns_finalizer = weakref.finalize(
+                self, _drop_compound_columns, id(self), len(self._compound_field_dtypes)
+            )
+        column.setflags(write=False)
+        key = (id(self), ind)
+        _drop_compound_column(key)
+        _compound_columns[key] = (weakref.ref(self), column)
+        _compound_columns_nbytes += column.nbytes
+        while _compound_columns_nbytes > _max_compound_columns_nbytes:
+            _, (_, old_column) = _compound_columns.popitem(last=False)
+            _compound_columns_nbytes -= old_column.nbytes
 
     def _get_external_hdf5_client(self, url: str) -> h5py.File:
-        if url not in _external_hdf5_clients:
-            if url.startswith("http://") or url.startswith("https://"):
-                ff = LindiRemfile(url, local_cache=self._file._local_cache)
-            else:
-                ff = open(url, "rb")  # this never gets closed
-            _external_hdf5_clients[url] = h5py.File(ff, "r")
-        return _external_hdf5_clients[url]
+        local_cache = self._file._local_cache
+        key = (url, local_cache._cache_dir if local_cache is not None else None)
+        if key in _external_hdf5_clients:
+            _external_hdf5_clients.move_to_end(key)
+            return _external_hdf5_clients[key][0]
+        if url.startswith("http://") or url.startswith("https://"):
+            ff = LindiRemfile(url, local_cache=local_cache)
+        else:
+            ff = open(url, "rb")
+        client = h5py.File(ff, "r")
+        _external_hdf5_clients[key] = (client, ff)
+        while len(_external_hdf5_clients) > _max_external_hdf5_clients:
+            _, (old_client, old_ff) = _external_hdf5_clients.popitem(last=False)
+            old_client.close()
+            old_ff.close()
+        return client
 
     @property
     def ref(self):
@@ -249,7 +369,12 @@ class LindiH5pyDatasetCompoundFieldSelection:
     For example, if the dataset has dtype [('x', 'f4'), ('y', 'f4')], then we
     can do dataset['x'][0] to get the first x value. The dataset['x'] returns an
     object of this class.
+
+    The data is read lazily, so that dataset['x'][0:10] only reads the chunks
+    that are needed for the selection.
     """
+    __slots__ = ('_dataset', '_ind', '_dtype', '_zarr_array', '_data')
+
     def __init__(self, *, dataset: LindiH5pyDataset, ind: int, dtype: np.dtype):
         self._dataset = dataset  # The parent dataset
         self._ind = ind  # The index of the field in the compound dtype
@@ -263,15 +388,20 @@ class LindiH5pyDatasetCompoundFieldSelection:
             raise TypeError(
                 f"Compound field selection only implemented for zarr.Array, not {type(self._dataset._zarr_array)}"
             )
-        za = self._dataset._zarr_array
-        self._zarr_array = za
-        # Prepare the data in memory
-        d = [za[i][self._ind] for i in range(len(za))]
-        if self._dtype == h5py.Reference:
-            # Convert to LindiH5pyReference
-            # Every element in the selection should be a reference dict
-            d = [LindiH5pyReference(x['_REFERENCE']) for x in d]
-        self._data = np.array(d, dtype=self._dtype)
+        self._zarr_array = self._dataset._zarr_array
+        # This is only set if _prefetch() is called
+        self._data: Union[np.ndarray, None] = None
+
+    def _prefetch(self):
+        """Read all the values of this field into memory"""
+        if self._data is None:
+            # The values are cached so that selecting the same field of the
+            # same dataset again does not read the zarr array again
+            data = self._dataset._get_compound_column(self._ind)
+            if data is None:
+                data = _get_compound_field_values(self._zarr_array[:], self._ind, self._dtype)
+                self._dataset._set_compound_column(self._ind, data)
+            self._data = data
 
     def __len__(self):
         """We conform to h5py, which is the number of elements in the first dimension. TypeError if scalar"""
@@ -284,6 +414,8 @@ class LindiH5pyDatasetCompoundFieldSelection:
         shape = self.shape
         if len(shape) == 0:
             raise TypeError("Can't iterate over a scalar dataset")
+        # Avoid reading the zarr array once for every element
+        self._prefetch()
         for i in range(shape[0]):
             yield self[i]
 
@@ -297,11 +429,79 @@ class LindiH5pyDatasetCompoundFieldSelection:
 
     @property
     def dtype(self):
-        self._dtype
+        return self._dtype
 
     @property
     def size(self):
-        return self._data.size
+        return self._zarr_array.size
 
     def __getitem__(self, selection):
-        return decode_references(self._data[selection])
+        if self._data is None:
+            self._data = self._dataset._get_compound_column(self._ind)
+        if self._data is not None:
+            # The values may be shared with the cache, so the caller gets a
+            # copy that can be modified
+            ret = self._data[selection]
+            if isinstance(ret, np.ndarray):
+                ret = ret.copy()
+            return decode_references(ret)
+        if not _is_basic_selection(selection):
+            # Selections such as boolean masks, lists of indices and slices
+            # with a negative step are not supported by zarr basic indexing,
+            # so they are applied to all the values of the field
+            self._prefetch()
+            return self[selection]
+        return _get_compound_field_values(self._zarr_array[selection], self._ind, self._dtype)
+
+
+def _is_basic_selection(selection: Any) -> bool:
+    # Whether the selection of a 1D array only uses ints, slices with a
+    # positive step and Ellipsis, which can be passed to zarr as they are
+    if isinstance(selection, tuple):
+        return all(_is_basic_selection(s) for s in selection)
+    if selection is Ellipsis:
+        return True
+    if isinstance(selection, slice):
+        return selection.step is None or selection.step > 0
+    return isinstance(selection, (int, np.integer)) and not isinstance(selection, bool)
+
+
+def _drop_compound_column(key: Tuple[int, int]):
+    global _compound_columns_nbytes
+    entry = _compound_columns.pop(key, None)
+    if entry is not None:
+        _compound_columns_nbytes -= entry[1].nbytes
+
+
+def _drop_compound_columns(dataset_id: int, num_fields: int):
+    # Called when a dataset is garbage collected
+    for ind in range(num_fields):
+        _drop_compound_column((dataset_id, ind))
+
+
+def _get_compound_field_values(rows: Any, ind: int, dtype: Any):
+    # Each row of the compound zarr array is a list of the field values
+    if isinstance(rows, list):
+        # A single row was selected
+        x = rows[ind]
+        if dtype == h5py.Reference:
+            return _get_compound_object_value(x)
+        return np.array(x, dtype=dtype)[()]
+    # Fill the output array directly rather than building an intermediate
+    # list of the values
+    flat_rows = rows.reshape(-1)
+    if dtype == h5py.Reference:
+        # Object fields are usually references, but they can also be
+        # variable-length strings, which are returned as they are
+        ret = np.empty(len(flat_rows), dtype=object)
+        for i, row in enumerate(flat_rows):
+            ret[i] = _get_compound_object_value(row[ind])
+    else:
+        ret = np.fromiter((row[ind] for row in flat_rows), dtype=dtype, count=len(flat_rows))
+    return ret.reshape(rows.shape)
+
+
+def _get_compound_object_value(x: Any):
+    if isinstance(x, dict) and '_REFERENCE' in x:
+        return LindiH5pyReference(x['_REFERENCE'])
+    return x
@@ -1,16 +1,22 @@
-from typing import Union, Literal
+from typing import Dict, List, Tuple, Union, Literal
+from collections import OrderedDict
 import os
+import stat
+import bisect
+import functools
 import json
 import tempfile
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 import h5py
 import zarr
 from zarr.storage import Store as ZarrStore
+from zarr.util import normalize_storage_path
 
 from .LindiH5pyGroup import LindiH5pyGroup
+from .LindiH5pyDataset import LindiH5pyDataset
 from .LindiH5pyAttributes import LindiH5pyAttributes
 from .LindiH5pyReference import LindiH5pyReference
-from .LindiReferenceFileSystemStore import LindiReferenceFileSystemStore
+from .LindiReferenceFileSystemStore import LindiReferenceFileSystemStore, _http_session, _max_download_workers
 
 from ..LindiH5ZarrStore.LindiH5ZarrStoreOpts import LindiH5ZarrStoreOpts
 
@@ -24,6 +30,10 @@ from ..tar.LindiTarStore import LindiTarStore
 
 LindiFileMode = Literal["r", "r+", "w", "w-", "x", "a"]
 
+# The maximum number of groups and datasets kept by path on a read-only file.
+# The same limit applies to the parent groups kept by path.
+_max_item_cache_entries = 2048
+
 
 class LindiH5pyFile(h5py.File):
     def __init__(self, _zarr_group: zarr.Group, *, _zarr_store: ZarrStore, _mode: LindiFileMode = "r", _local_cache: Union[LocalCache, None] = None, _source_url_or_path: Union[str, None] = None, _source_tar_file: Union[LindiTarFile, None] = None, _close_source_tar_file_on_close: bool = False):
@@ -35,17 +45,54 @@ class LindiH5pyFile(h5py.File):
         self._zarr_group = _zarr_group
         self._zarr_store = _zarr_store
         self._mode: LindiFileMode = _mode
-        self._the_group = LindiH5pyGroup(_zarr_group, self)
+        # The mode does not change, so whether the file is read-only is
+        # decided once here rather than by comparing strings on each use
+        self._readonly = _mode == "r"
         self._local_cache = _local_cache
         self._source_url_or_path = _source_url_or_path
+        self._source_is_url = _source_url_or_path is not None and _is_url(_source_url_or_path)
         self._source_tar_file = _source_tar_file
         self._close_source_tar_file_on_close = _close_source_tar_file_on_close
 
         # see comment in LindiH5pyGroup
         self._id = f'{id(self._zarr_group)}/'
 
+        # The hash is based on the identity of the object, so it is computed
+        # once here (see __hash__)
+        self._hash = id(self)
+
+        # For read-only files, the parent groups resolved when accessing items
+        # by path are kept in an LRU cache so that sibling paths do not walk
+        # the hierarchy again. The key is the tuple of path components.
+        self._parent_group_cache: "Union[OrderedDict[Tuple[str, ...], LindiH5pyGroup], None]" = OrderedDict() if self._readonly else None
+
+        # For read-only files, the groups and datasets returned by name are
+        # kept in an LRU cache so that repeated accesses of the same path
+        # return the same object (along with its cached dtype, attrs, etc.)
+        self._item_cache: "Union[OrderedDict[str, Union[LindiH5pyGroup, LindiH5pyDataset]], None]" = OrderedDict() if self._readonly else None
+
+        # This is set on the first access of the attrs property
+        self._cached_attrs: Union[LindiH5pyAttributes, None] = None
+
+        # For read-only files, this is set when the first reference is resolved
+        self._root_object_id: Union[str, None] = None
+
+        # The version of the reference file system that is known to be on
+        # disk, so that flushing is skipped when nothing has changed
+        self._flushed_rfs_version = self._get_rfs_version()
+
+        # The sorted keys of the refs, along with the version of the reference
+        # file system they were computed for (see copy())
+        self._sorted_ref_keys: Union[Tuple[int, List[str]], None] = None
+
         self._is_open = True
 
+    @functools.cached_property
+    def _the_group(self) -> LindiH5pyGroup:
+        # This is created on first use so that opening a file is cheap when
+        # only file-level properties are accessed
+        return LindiH5pyGroup(self._zarr_group, self)
+
     @staticmethod
     def from_lindi_file(url_or_path: str, *, mode: LindiFileMode = "r", local_cache: Union[LocalCache, None] = None):
         """
@@ -127,10 +174,10 @@ class LindiH5pyFile(h5py.File):
                 raise Exception("_source_file_path is not None even though rfs is a string")  # pragma: no cover
             if _source_tar_file is not None:
                 raise Exception("_source_tar_file is not None even though rfs is a string")  # pragma: no cover
-            rfs_is_url = rfs.startswith("http://") or rfs.startswith("https://")
+            rfs_is_url = _is_url(rfs)
             if rfs_is_url:
-                data, tar_file = _load_rfs_from_url(rfs)
-                return LindiH5pyFile.from_reference_file_system(
+                data, tar_file = _load_rfs_from_url(rfs, use_cache=mode == "r")
+                return LindiH5pyFile._from_rfs_dict(
                     data,
                     mode=mode,
                     local_cache=local_cache,
@@ -140,14 +187,21 @@ class LindiH5pyFile(h5py.File):
                 )
             else:
                 # local file (or directory)
+                # A single stat tells whether the file exists, and is reused
+                # when loading the file. Like os.path.exists, any error is
+                # treated as the file not existing.
+                try:
+                    st: Union[os.stat_result, None] = os.stat(rfs)
+                except (OSError, ValueError):
+                    st = None
                 need_to_create_empty_file = False
                 if mode == "r":
                     # Readonly, file must exist (default)
-                    if not os.path.exists(rfs):
+                    if st is None:
                         raise FileNotFoundError(f"File does not exist: {rfs}")
                 elif mode == "r+":
                     # Read/write, file must exist
-                    if not os.path.exists(rfs):
+                    if st is None:
                         raise FileNotFoundError(f"File does not exist: {rfs}")
                 elif mode == "w":
                     # Create file, truncate if exists
@@ -155,14 +209,14 @@ class LindiH5pyFile(h5py.File):
 
                 elif mode in ["w-", "x"]:
                     # Create file, fail if exists
-                    if os.path.exists(rfs):
+                    if st is not None:
                         raise ValueError(f"File already exists: {rfs}")
                     need_to_create_empty_file = True
                     # Now that we have already checked for existence, let's just change mode to 'w'
                     mode = 'w'
                 elif mode == "a":
                     # Read/write if exists, create otherwise
-                    if not os.path.exists(rfs):
+                    if st is None:
                         need_to_create_empty_file = True
                 else:
                     raise Exception(f"Unhandled mode: {mode}")  # pragma: no cover
@@ -170,9 +224,10 @@ class LindiH5pyFile(h5py.File):
                     is_tar = rfs.endswith(".tar")
                     is_dir = rfs.endswith(".d")
                     _create_empty_lindi_file(rfs, is_tar=is_tar, is_dir=is_dir)
-                data, tar_file = _load_rfs_from_local_file_or_dir(rfs)
-                assert isinstance(data, dict)  # prevent infinite recursion
-                return LindiH5pyFile.from_reference_file_system(
+                    # the stat is out of date once the file is created
+                    st = None
+                data, tar_file = _load_rfs_from_local_file_or_dir(rfs, use_cache=mode == "r", st=st)
+                return LindiH5pyFile._from_rfs_dict(
                     data,
                     mode=mode,
                     local_cache=local_cache,
@@ -181,18 +236,8 @@ class LindiH5pyFile(h5py.File):
                     _close_source_tar_file_on_close=True
                 )
         elif isinstance(rfs, dict):
-            # This store does not need to be closed
-            store = LindiReferenceFileSystemStore(
+            return LindiH5pyFile._from_rfs_dict(
                 rfs,
-                local_cache=local_cache,
-                _source_url_or_path=_source_url_or_path,
-                _source_tar_file=_source_tar_file
-            )
-            source_is_url = _source_url_or_path is not None and (_source_url_or_path.startswith("http://") or _source_url_or_path.startswith("https://"))
-            if _source_url_or_path and _source_tar_file and not source_is_url:
-                store = LindiTarStore(base_store=store, tar_file=_source_tar_file)
-            return LindiH5pyFile.from_zarr_store(
-                store,
                 mode=mode,
                 local_cache=local_cache,
                 _source_url_or_path=_source_url_or_path,
@@ -202,6 +247,32 @@ class LindiH5pyFile(h5py.File):
         else:
             raise Exception(f"Unhandled type for rfs: {type(rfs)}")  # pragma: no cover
 
+    @staticmethod
+    def _from_rfs_dict(rfs: dict, *, mode: LindiFileMode, local_cache: Union[LocalCache, None], _source_url_or_path: Union[str, None], _source_tar_file: Union[LindiTarFile, None], _close_source_tar_file_on_close: bool):
+        # The loaded JSON could be something other than an object. This is
+        # checked with an exception rather than an assert so that it still
+        # happens when running with python -O
+        if not isinstance(rfs, dict):
+            raise TypeError(f"Reference file system must be a dict, got {type(rfs).__name__}")
+        # This store does not need to be closed
+        store = LindiReferenceFileSystemStore(
+            rfs,
+            local_cache=local_cache,
+            _source_url_or_path=_source_url_or_path,
+            _source_tar_file=_source_tar_file
+        )
+        source_is_url = _source_url_or_path is not None and _is_url(_source_url_or_path)
+        if _source_url_or_path and _source_tar_file and not source_is_url:
+            store = LindiTarStore(base_store=store, tar_file=_source_tar_file)
+        return LindiH5pyFile.from_zarr_store(
+            store,
+            mode=mode,
+            local_cache=local_cache,
+            _source_url_or_path=_source_url_or_path,
+            _source_tar_file=_source_tar_file,
+            _close_source_tar_file_on_close=_close_source_tar_file_on_close
+        )
+
     @staticmethod
     def from_zarr_store(zarr_store: ZarrStore, mode: LindiFileMode = "r", local_cache: Union[LocalCache, None] = None, _source_url_or_path: Union[str, None] = None, _source_tar_file: Union[LindiTarFile, None] = None, _close_source_tar_file_on_close: bool = False):
         """
@@ -216,9 +287,14 @@ class LindiH5pyFile(h5py.File):
             "r", the file object will be read-only. For write mode to work, the
             zarr store will need to be writeable as well.
         """
-        # note that even though the function is called "open", the zarr_group
-        # does not need to be closed
-        zarr_group = zarr.open(store=zarr_store, mode=mode)
+        if mode == "r":
+            # The root is always a group, so for read-only access it is opened
+            # directly rather than having zarr.open check for an array first
+            zarr_group = zarr.Group(store=zarr_store, read_only=True)
+        else:
+            # note that even though the function is called "open", the
+            # zarr_group does not need to be closed
+            zarr_group = zarr.open(store=zarr_store, mode=mode)
         assert isinstance(zarr_group, zarr.Group)
         return LindiH5pyFile.from_zarr_group(zarr_group, _zarr_store=zarr_store, mode=mode, local_cache=local_cache, _source_url_or_path=_source_url_or_path, _source_tar_file=_source_tar_file, _close_source_tar_file_on_close=_close_source_tar_file_on_close)
 
@@ -256,7 +332,7 @@ class LindiH5pyFile(h5py.File):
         if not isinstance(zarr_store, LindiReferenceFileSystemStore):
             raise Exception(f"Cannot create reference file system when zarr store has type {type(self._zarr_store)}")  # pragma: no cover
         rfs = zarr_store.rfs
-        rfs_copy = json.loads(json.dumps(rfs))
+        rfs_copy = _copy_rfs(rfs)
         LindiReferenceFileSystemStore.replace_meta_file_contents_with_dicts_in_rfs(rfs_copy)
         LindiReferenceFileSystemStore.use_templates_in_rfs(rfs_copy)
         return rfs_copy
@@ -278,8 +354,7 @@ class LindiH5pyFile(h5py.File):
             raise ValueError("Filename must end with '.lindi.json', '.lindi.tar', or '.lindi.d'.")
         rfs = self.to_reference_file_system()
         if self._source_tar_file:
-            source_is_remote = self._source_url_or_path is not None and (self._source_url_or_path.startswith("http://") or self._source_url_or_path.startswith("https://"))
-            if not source_is_remote:
+            if not self._source_is_url:
                 raise ValueError("Cannot write to lindi file if the source is a local lindi tar file because it would not be able to resolve the local references within the tar file.")
             assert self._source_url_or_path is not None
             _update_internal_references_to_remote_tar_file(rfs, self._source_url_or_path, self._source_tar_file)
@@ -296,7 +371,9 @@ class LindiH5pyFile(h5py.File):
 
     @property
     def attrs(self):  # type: ignore
-        return LindiH5pyAttributes(self._zarr_group.attrs, readonly=self.mode == "r")
+        if self._cached_attrs is None:
+            self._cached_attrs = LindiH5pyAttributes(self._zarr_group.attrs, readonly=self._readonly)
+        return self._cached_attrs
 
     @property
     def filename(self):
@@ -308,7 +385,7 @@ class LindiH5pyFile(h5py.File):
 
     @property
     def mode(self):
-        return 'r' if self._mode == 'r' else 'r+'
+        return 'r' if self._readonly else 'r+'
 
     @property
     def libver(self):
@@ -337,16 +414,28 @@ class LindiH5pyFile(h5py.File):
     def flush(self):
         if not self._is_open:
             return  # pragma: no cover
-        if self._mode != 'r' and self._source_url_or_path is not None:
-            is_url = self._source_url_or_path.startswith("http://") or self._source_url_or_path.startswith("https://")
-            if is_url:
+        if not self._readonly and self._source_url_or_path is not None:
+            if self._source_is_url:
                 raise Exception("Cannot write to URL")  # pragma: no cover
+            rfs_version = self._get_rfs_version()
+            if rfs_version is not None and rfs_version == self._flushed_rfs_version:
+                # nothing has changed since the file was opened or last flushed
+                return
             rfs = self.to_reference_file_system()
             if self._source_tar_file:
                 self._source_tar_file.write_rfs(rfs)
                 self._source_tar_file._update_index_in_file()  # very important
             else:
                 _write_rfs_to_file(rfs=rfs, output_file_name=self._source_url_or_path)
+            self._flushed_rfs_version = rfs_version
+
+    def _get_rfs_version(self) -> Union[int, None]:
+        zarr_store = self._zarr_store
+        if isinstance(zarr_store, LindiTarStore):
+            zarr_store = zarr_store._base_store
+        if isinstance(zarr_store, LindiReferenceFileSystemStore):
+            return zarr_store._version
+        return None
 
     def __enter__(self):  # type: ignore
         return self
@@ -366,7 +455,7 @@ class LindiH5pyFile(h5py.File):
 
     def __hash__(self):
         # This is called for example when using a file as a key in a dictionary
-        return id(self)
+        return self._hash
 
     def copy(self, source, dest, name=None,
              shallow=False, expand_soft=False, expand_external=False,
@@ -383,50 +472,137 @@ class LindiH5pyFile(h5py.File):
             raise Exception("without_attrs is not implemented for copy")
         if name is None:
             raise Exception("name must be provided for copy")
+        if isinstance(dest, (LindiH5pyFile, LindiH5pyGroup)) and dest._readonly:
+            raise ValueError("Cannot copy into read-only file")
         src_item = self._get_item(source)
         if not isinstance(src_item, (h5py.Group, h5py.Dataset)):
             raise Exception(f"Unexpected type for source in copy: {type(src_item)}")  # pragma: no cover
-        _recursive_copy(src_item, dest, name=name)
+        sorted_src_ref_keys = None
+        if isinstance(dest, LindiH5pyFile):
+            src_zarr_store = self._zarr_store
+            if isinstance(src_zarr_store, LindiReferenceFileSystemStore) and isinstance(dest._zarr_store, LindiReferenceFileSystemStore):
+                # Sort the keys once so that the refs of each copied dataset
+                # can be found without scanning all the keys
+                sorted_src_ref_keys = self._get_sorted_ref_keys(src_zarr_store)
+        _recursive_copy(src_item, dest, name=name, _sorted_src_ref_keys=sorted_src_ref_keys)
+
+    def _get_sorted_ref_keys(self, zarr_store: LindiReferenceFileSystemStore) -> List[str]:
+        # The sorted keys are kept until the refs change, so that copying
+        # several items from the same file only sorts the keys once
+        if self._sorted_ref_keys is not None:
+            version, keys = self._sorted_ref_keys
+            if version == zarr_store._version:
+                return keys
+        keys = sorted(zarr_store.rfs['refs'])
+        self._sorted_ref_keys = (zarr_store._version, keys)
+        return keys
 
     def __delitem__(self, name):
-        parent_key = '/'.join(name.split('/')[:-1])
-        grp = self[parent_key]
+        parent_key, _, leaf = name.rpartition('/')
+        grp = self[parent_key] if parent_key else self._the_group
         assert isinstance(grp, LindiH5pyGroup)
-        del grp[name.split('/')[-1]]
+        del grp[leaf]
 
     # Group methods
     def __getitem__(self, name):  # type: ignore
         return self._get_item(name)
 
     def _get_item(self, name, getlink=False, default=None):
+        # Names are by far the most common case, so they are handled first,
+        # with an exact type check, whether or not the file is read-only
+        if type(name) is str:
+            item_cache = self._item_cache
+            if item_cache is None or getlink:
+                return self._get_item_by_name(name, getlink=getlink, default=default)
+            x = item_cache.get(name, None)
+            if x is not None:
+                item_cache.move_to_end(name)
+                return x
+            x = self._get_item_by_name(name, getlink=getlink, default=None)
+            if x is None:
+                return default
+            item_cache[name] = x
+            if len(item_cache) > _max_item_cache_entries:
+                item_cache.popitem(last=False)
+            return x
         if isinstance(name, LindiH5pyReference):
             if getlink:
                 raise Exception("Getting link is not allowed for references")
-            zarr_group = self._zarr_group
             if name._source != '.':
                 raise Exception(f'For now, source of reference must be ".", got "{name._source}"')  # pragma: no cover
             if name._source_object_id is not None:
-                if name._source_object_id != zarr_group.attrs.get("object_id"):  # pragma: no cover
-                    raise Exception(f'Mismatch in source object_id: "{name._source_object_id}" and "{zarr_group.attrs.get("object_id")}"')  # pragma: no cover
-            target = self[name._path]
+                root_object_id = self._get_root_object_id()
+                if name._source_object_id != root_object_id:  # pragma: no cover
+                    raise Exception(f'Mismatch in source object_id: "{name._source_object_id}" and "{root_object_id}"')  # pragma: no cover
+            target = self._resolve_path_flat(name._path)
             if name._object_id is not None:
                 if name._object_id != target.attrs.get("object_id"):  # pragma: no cover
                     raise Exception(f'Mismatch in object_id: "{name._object_id}" and "{target.attrs.get("object_id")}"')  # pragma: no cover
             return target
+        return self._get_item_by_name(name, getlink=getlink, default=default)
+
+    def _get_root_object_id(self):
+        # The object_id of the root group cannot change in a read-only file,
+        # so it only needs to be looked up once
+        if self._readonly:
+            if self._root_object_id is None:
+                self._root_object_id = self._zarr_group.attrs.get("object_id")
+            return self._root_object_id
+        return self._zarr_group.attrs.get("object_id")
+
+    def _resolve_path_flat(self, path: str):
+        # Resolve a reference path with a single lookup of the full path in
+        # the zarr store (.zgroup / .zarray), rather than walking the groups
+        # from the root
+        item_cache = self._item_cache
+        if item_cache is not None:
+            x = item_cache.get(path, None)
+            if x is not None:
+                item_cache.move_to_end(path)
+                return x
+        key = path.strip('/')
+        if not key:
+            return self._the_group
+        try:
+            x = self._the_group[key]
+        except KeyError:
+            # The path could go through a soft link, so fall back to walking
+            # the groups
+            return self[path]
+        if item_cache is not None:
+            item_cache[path] = x
+            if len(item_cache) > _max_item_cache_entries:
+                item_cache.popitem(last=False)
+        return x
+
+    def _get_item_by_name(self, name, getlink: bool, default):
         # if it contains slashes, it's a path
         if isinstance(name, str) and "/" in name:
-            parts = name.split("/")
-            x = self._the_group
-            for i, part in enumerate(parts):
-                if i == len(parts) - 1:
-                    assert isinstance(x, LindiH5pyGroup)
-                    x = x.get(part, default=default, getlink=getlink)
-                else:
-                    assert isinstance(x, LindiH5pyGroup)
-                    x = x.get(part)
-            return x
+            parts = _split_path(name)
+            if not parts:
+                return self._the_group
+            parent = self._get_parent_group(parts[:-1])
+            return parent.get(parts[-1], default=default, getlink=getlink)
         return self._the_group.get(name, default=default, getlink=getlink)
 
+    def _get_parent_group(self, parts: Tuple[str, ...]) -> LindiH5pyGroup:
+        cache = self._parent_group_cache
+        if cache is not None:
+            x = cache.get(parts, None)
+            if x is not None:
+                cache.move_to_end(parts)
+                return x
+        x = self._the_group
+        for part in parts:
+            assert isinstance(x, LindiH5pyGroup)
+            x = x.get(part)
+        assert isinstance(x, LindiH5pyGroup)
+        if cache is not None:
+            cache[parts] = x
+            if len(cache) > _max_item_cache_entries:
+                cache.popitem(last=False)
+        return x
+
     def get(self, name, default=None, getclass=False, getlink=False):
         if getclass:
             raise Exception("Getting class is not allowed")
@@ -445,6 +621,19 @@ class LindiH5pyFile(h5py.File):
         return self._the_group.__reversed__()
 
     def __contains__(self, name):
+        zarr_store = self._zarr_store
+        if isinstance(name, str) and isinstance(zarr_store, LindiReferenceFileSystemStore):
+            # For a reference file system, check the refs directly rather
+            # than going through the zarr group. The path is normalized the
+            # same way zarr does it, and paths that zarr does not accept are
+            # left to the zarr group.
+            try:
+                key = normalize_storage_path(name)
+            except ValueError:
+                key = ''
+            if key:
+                refs = zarr_store.rfs['refs']
+                return f'{key}/.zgroup' in refs or f'{key}/.zarray' in refs
         return self._the_group.__contains__(name)
 
     @property
@@ -454,11 +643,13 @@ class LindiH5pyFile(h5py.File):
 
     @property
     def file(self):
-        return self._the_group.file
+        # The root group's file is this file, so there is no need to go
+        # through the group
+        return self
 
     @property
     def name(self):
-        return self._the_group.name
+        return self._zarr_group.name
 
     @property
     def ref(self):
@@ -467,81 +658,136 @@ class LindiH5pyFile(h5py.File):
     ##############################
     # write
     def create_group(self, name, track_order=None):
-        if self._mode == 'r':
+        if self._readonly:
             raise ValueError("Cannot create group in read-only mode")
         if track_order is not None:
             raise Exception("track_order is not supported (I don't know what it is)")
         return self._the_group.create_group(name)
 
     def require_group(self, name):
-        if self._mode == 'r':
+        if self._readonly:
             raise ValueError("Cannot require group in read-only mode")
         return self._the_group.require_group(name)
 
     def create_dataset(self, name, shape=None, dtype=None, data=None, **kwds):
-        if self._mode == 'r':
+        if self._readonly:
             raise ValueError("Cannot create dataset in read-only mode")
         return self._the_group.create_dataset(name, shape=shape, dtype=dtype, data=data, **kwds)
 
     def require_dataset(self, name, shape, dtype, exact=False, **kwds):
-        if self._mode == 'r':
+        if self._readonly:
             raise ValueError("Cannot require dataset in read-only mode")
         return self._the_group.require_dataset(name, shape, dtype, exact=exact, **kwds)
 
 
-def _download_file(url: str, filename: str) -> None:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-    }
-    req = urllib.request.Request(url, headers=headers)
-    with urllib.request.urlopen(req) as response:
-        with open(filename, "wb") as f:
-            f.write(response.read())
-
-
-def _recursive_copy(src_item: Union[h5py.Group, h5py.Dataset], dest: h5py.File, name: str) -> None:
-    if isinstance(src_item, h5py.Group):
-        dst_item = dest.create_group(name)
-        for k, v in src_item.attrs.items():
-            dst_item.attrs[k] = v
-        for k, v in src_item.items():
-            _recursive_copy(v, dest, name=f'{name}/{k}')
-    elif isinstance(src_item, h5py.Dataset):
-        # Let's specially handle the case where the source and dest files
-        # are LindiH5pyFiles with reference file systems as the internal
-        # representation. In this case, we don't need to copy the actual
-        # data because we can copy the reference.
-        if isinstance(src_item.file, LindiH5pyFile) and isinstance(dest, LindiH5pyFile):
-            if src_item.name is None:
-                raise Exception("src_item.name is None")  # pragma: no cover
-            src_item_name = _without_initial_slash(src_item.name)
-            src_zarr_store = src_item.file._zarr_store
-            dst_zarr_store = dest._zarr_store
-            if src_zarr_store is not None and dst_zarr_store is not None:
-                if isinstance(src_zarr_store, LindiReferenceFileSystemStore) and isinstance(dst_zarr_store, LindiReferenceFileSystemStore):
-                    src_rfs = src_zarr_store.rfs
-                    dst_rfs = dst_zarr_store.rfs
+def _is_url(url_or_path: str) -> bool:
+    return url_or_path.startswith(("http://", "https://"))
+
+
+def _recursive_copy(src_item: Union[h5py.Group, h5py.Dataset], dest: h5py.File, name: str, *, _sorted_src_ref_keys: Union[List[str], None] = None) -> None:
+    # Walk the tree with an explicit stack rather than by recursion
+    stack = [(src_item, name)]
+    while stack:
+        src, dst_name = stack.pop()
+        if isinstance(src, h5py.Group):
+            dst_item = dest.create_group(dst_name)
+            if not _copy_zattrs_ref(src, dest, dst_name):
+                # Set all the attributes at once so that .zattrs is written once
+                dst_item.attrs.update(dict(src.attrs))
+            # Push in reverse so that the children are copied in order
+            children = [(v, f'{dst_name}/{k}') for k, v in src.items()]
+            stack.extend(reversed(children))
+        elif isinstance(src, h5py.Dataset):
+            _copy_dataset(src, dest, dst_name, _sorted_src_ref_keys=_sorted_src_ref_keys)
+        else:
+            raise Exception(f"Unexpected type for src_item in _recursive_copy: {type(src)}")
+
+
+def _copy_zattrs_ref(src_item: h5py.Group, dest: h5py.File, name: str) -> bool:
+    # When both files are backed by reference file systems, the .zattrs of a
+    # group can be copied as is, rather than decoding and encoding each
+    # attribute. Returns False if this is not possible.
+    if not isinstance(src_item.file, LindiH5pyFile) or not isinstance(dest, LindiH5pyFile):
+        return False
+    src_zarr_store = src_item.file._zarr_store
+    dst_zarr_store = dest._zarr_store
+    if not isinstance(src_zarr_store, LindiReferenceFileSystemStore) or not isinstance(dst_zarr_store, LindiReferenceFileSystemStore):
+        return False
+    if src_item.name is None:
+        raise Exception("src_item.name is None")  # pragma: no cover
+    src_item_name = src_item.name.strip('/')
+    src_key = f'{src_item_name}/.zattrs' if src_item_name else '.zattrs'
+    val = src_zarr_store.rfs['refs'].get(src_key, None)
+    if val is None:
+        # the source group has no attributes
+        return True
+    if not isinstance(val, (str, dict)):
+        return False
+    dst_zarr_store.rfs['refs'][f'{_without_initial_slash(name)}/.zattrs'] = _copy_ref_value(val)
+    dst_zarr_store._version += 1
+    return True
+
+
+def _copy_dataset(src_item: h5py.Dataset, dest: h5py.File, name: str, *, _sorted_src_ref_keys: Union[List[str], None] = None) -> None:
+    # Let's specially handle the case where the source and dest files
+    # are LindiH5pyFiles with reference file systems as the internal
+    # representation. In this case, we don't need to copy the actual
+    # data because we can copy the reference.
+    if isinstance(src_item.file, LindiH5pyFile) and isinstance(dest, LindiH5pyFile):
+        if src_item.name is None:
+            raise Exception("src_item.name is None")  # pragma: no cover
+        src_item_name = _without_initial_slash(src_item.name)
+        src_zarr_store = src_item.file._zarr_store
+        dst_zarr_store = dest._zarr_store
+        if src_zarr_store is not None and dst_zarr_store is not None:
+            if isinstance(src_zarr_store, LindiReferenceFileSystemStore) and isinstance(dst_zarr_store, LindiReferenceFileSystemStore):
+                src_rfs = src_zarr_store.rfs
+                dst_rfs = dst_zarr_store.rfs
+                prefix = f'{src_item_name}/'
+                if _sorted_src_ref_keys is not None:
+                    # The keys with this prefix are contiguous in the sorted list
+                    ind = bisect.bisect_left(_sorted_src_ref_keys, prefix)
+                    src_ref_keys = []
+                    while ind < len(_sorted_src_ref_keys) and _sorted_src_ref_keys[ind].startswith(prefix):
+                        src_ref_keys.append(_sorted_src_ref_keys[ind])
+                        ind += 1
+                else:
                     src_ref_keys = list(src_rfs['refs'].keys())
-                    for src_ref_key in src_ref_keys:
-                        if src_ref_key.startswith(f'{src_item_name}/'):
-                            dst_ref_key = f'{name}/{src_ref_key[len(src_item_name) + 1:]}'
-                            # important to do a deep copy
-                            val = _deep_copy(src_rfs['refs'][src_ref_key])
-                            if isinstance(val, list) and len(val) > 0:
-                                # if it's a list then we need to resolve any
-                                # templates in the first element of the list.
-                                # This is very important because the destination
-                                # rfs will probably have different templates.
-                                url0 = _apply_templates(val[0], src_rfs.get('templates', {}))
-                                val[0] = url0
-                            dst_rfs['refs'][dst_ref_key] = val
-                    return
-
-        dst_item = dest.create_dataset(name, data=src_item[()], chunks=src_item.chunks)
-        for k, v in src_item.attrs.items():
-            dst_item.attrs[k] = v
-    else:
-        raise Exception(f"Unexpected type for src_item in _recursive_copy: {type(src_item)}")
+                src_refs = src_rfs['refs']
+                src_templates = src_rfs.get('templates', {})
+                prefix_len = len(prefix)
+                # Many chunks share the same url, so we only apply the
+                # templates once per distinct url
+                resolved_urls: Dict[str, str] = {}
+                new_refs = {}
+                for src_ref_key in src_ref_keys:
+                    if src_ref_key.startswith(prefix):
+                        # important to do a deep copy
+                        val = _copy_ref_value(src_refs[src_ref_key])
+                        if isinstance(val, list) and len(val) > 0:
+                            # if it's a list then we need to resolve any
+                            # templates in the first element of the list.
+                            # This is very important because the destination
+                            # rfs will probably have different templates.
+                            url0 = resolved_urls.get(val[0], None)
+                            if url0 is None:
+                                url0 = _apply_templates(val[0], src_templates)
+                                resolved_urls[val[0]] = url0
+                            val[0] = url0
+                        new_refs[f'{name}/{src_ref_key[prefix_len:]}'] = val
+                dst_rfs['refs'].update(new_refs)
+                dst_zarr_store._version += 1
+                return
+
+    dst_item = dest.create_dataset(name, data=src_item[()], chunks=src_item.chunks)
+    dst_item.attrs.update(dict(src_item.attrs))
+
+
+@functools.lru_cache(maxsize=1024)
+def _split_path(name: str) -> Tuple[str, ...]:
+    # Empty components from leading, trailing or double slashes are dropped
+    # so that they do not cost a group lookup each
+    return tuple(p for p in name.split("/") if p)
 
 
 def _without_initial_slash(s: str) -> str:
@@ -550,10 +796,35 @@ def _without_initial_slash(s: str) -> str:
     return s
 
 
+def _copy_rfs(rfs: dict) -> dict:
+    """Make a deep copy of a reference file system.
+
+    This is faster than a generic deep copy because it uses the known
+    structure of the refs: the values are strings (immutable), lists of
+    [url, offset, size] (only the list itself needs to be copied), or dicts.
+    """
+    refs_copy = {k: _copy_ref_value(v) for k, v in rfs["refs"].items()}
+    return {k: refs_copy if k == "refs" else _deep_copy(v) for k, v in rfs.items()}
+
+
+def _copy_ref_value(v):
+    """Make a deep copy of a value in the refs of a reference file system."""
+    if v.__class__ is str:
+        return v
+    elif v.__class__ is list:
+        # [url, offset, size] only contains immutable elements
+        return v[:]
+    else:
+        return _deep_copy(v)
+
+
 def _deep_copy(obj):
-    if isinstance(obj, dict):
+    c = obj.__class__
+    if c is str or c is int or c is float:
+        return obj
+    elif c is dict or isinstance(obj, dict):
         return {k: _deep_copy(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
+    elif c is list or isinstance(obj, list):
         return [_deep_copy(v) for v in obj]
     elif isinstance(obj, tuple):
         return tuple(_deep_copy(v) for v in obj)
@@ -561,19 +832,62 @@ def _deep_copy(obj):
         return obj
 
 
-def _load_rfs_from_url(url: str):
-    file_size = _get_file_size_of_remote_file(url)
+# This is a global LRU cache of the reference file systems of .lindi.json
+# files that were opened read-only, so that opening the same file again does
+# not need to download and parse it again. The key is the URL or absolute path
+# of the file together with its version (the ETag or Last-Modified header for
+# URLs, or the modification time and size for local files). The cached dicts
+# are shared between files and must not be modified. Tar files are not cached
+# because the returned LindiTarFile is tied to the file object.
+_max_rfs_cache_entries = 32
+_rfs_cache: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+
+
+def _get_cached_rfs(key: Tuple[str, str]) -> Union[dict, None]:
+    rfs = _rfs_cache.get(key, None)
+    if rfs is not None:
+        _rfs_cache.move_to_end(key)
+    return rfs
+
+
+def _set_cached_rfs(key: Tuple[str, str], rfs: dict) -> None:
+    _rfs_cache[key] = rfs
+    while len(_rfs_cache) > _max_rfs_cache_entries:
+        _rfs_cache.popitem(last=False)
+
+
+def _load_rfs_from_url(url: str, *, use_cache: bool = False):
+    # A single range request gives the start of the file (enough to check for
+    # a tar header, or all of a small file) along with its size and version
+    head_buf, file_size, file_version = _download_file_head(url, _remote_file_head_size)
+    cache_key = (url, file_version) if use_cache and file_version is not None else None
+    if cache_key is not None:
+        cached_rfs = _get_cached_rfs(cache_key)
+        if cached_rfs is not None:
+            return cached_rfs, None
+    rfs, tar_file = _load_rfs_from_url_helper(url, file_size, head_buf)
+    if cache_key is not None and tar_file is None:
+        _set_cached_rfs(cache_key, rfs)
+    return rfs, tar_file
+
+
+def _load_rfs_from_url_helper(url: str, file_size: int, head_buf: bytes):
+    is_tar = _check_is_tar_header(head_buf[:512])
     if file_size < 1024 * 1024 * 2:
         # if it's a small file, we'll just download the whole thing
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmp_fname = f"{tmpdir}/temp.lindi.json"
-            _download_file(url, tmp_fname)
-            data, tar_file = _load_rfs_from_local_file_or_dir(tmp_fname)
-            return data, tar_file
+        buf = _download_rest_of_file(url, file_size, head_buf)
+        if is_tar:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                tmp_fname = f"{tmpdir}/temp.lindi.json"
+                with open(tmp_fname, "wb") as f:
+                    f.write(buf)
+                data, tar_file = _load_rfs_from_local_file_or_dir(tmp_fname)
+                return data, tar_file
+        # Parse the json directly from memory rather than going through a
+        # temporary file
+        return json.loads(buf), None
     else:
-        # if it's a large file, we start by downloading the entry file and then the index file
-        tar_entry_buf = _download_file_byte_range(url, 0, 512)
-        is_tar = _check_is_tar_header(tar_entry_buf[:512])
+        # if it's a large file, we use the entry file and then the index file
         if is_tar:
             tar_file = LindiTarFile(url)
             rfs_json = tar_file.read_file("lindi.json")
@@ -581,20 +895,33 @@ def _load_rfs_from_url(url: str):
             return rfs, tar_file
         else:
             # In this case, it must be a regular json file
-            with tempfile.TemporaryDirectory() as tmpdir:
-                tmp_fname = f"{tmpdir}/temp.lindi.json"
-                _download_file(url, tmp_fname)
-                with open(tmp_fname, "r") as f:
-                    return json.load(f), None
-
-
-def _load_rfs_from_local_file_or_dir(fname: str):
-    if os.path.isdir(fname):
+            return json.loads(_download_rest_of_file(url, file_size, head_buf)), None
+
+
+def _load_rfs_from_local_file_or_dir(fname: str, *, use_cache: bool = False, st: Union[os.stat_result, None] = None):
+    # A single stat gives the type, size and modification time of the file.
+    # The caller can pass a stat that it has already done.
+    if st is None:
+        st = os.stat(fname)
+    cache_key = None
+    if use_cache and stat.S_ISREG(st.st_mode):
+        cache_key = (os.path.abspath(fname), f'{st.st_mtime_ns}-{st.st_size}')
+        cached_rfs = _get_cached_rfs(cache_key)
+        if cached_rfs is not None:
+            return cached_rfs, None
+    rfs, tar_file = _load_rfs_from_local_file_or_dir_helper(fname, st)
+    if cache_key is not None and tar_file is None:
+        _set_cached_rfs(cache_key, rfs)
+    return rfs, tar_file
+
+
+def _load_rfs_from_local_file_or_dir_helper(fname: str, st: os.stat_result):
+    if stat.S_ISDIR(st.st_mode):
         dir_file = LindiTarFile(fname, dir_representation=True)
         rfs_json = dir_file.read_file("lindi.json")
         rfs = json.loads(rfs_json)
         return rfs, dir_file
-    file_size = os.path.getsize(fname)
+    file_size = st.st_size
     if file_size >= 512:
         # Read first bytes to check if it's a tar file
         with open(fname, "rb") as f:
@@ -623,31 +950,69 @@ def _check_is_tar_header(header_buf: bytes) -> bool:
         # byte 262
         return True
 
-    # Check for any 0 bytes in the header
+    # Check for any 0 bytes in the header. This only runs when the ustar
+    # magic is absent. Valid JSON cannot contain raw 0 bytes (they must be
+    # escaped), so this only rejects files that are neither json nor ustar.
     if b"\0" in header_buf:
-        print(header_buf[257:262])
-        raise Exception("Problem with lindi file: 0 byte found in header, but not ustar tar format")
+        raise Exception(f"Problem with lindi file: 0 byte found in header, but not ustar tar format (found {header_buf[257:262]!r} at the ustar magic position)")
 
     return False
 
 
-def _get_file_size_of_remote_file(url: str) -> int:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
-    }
-    req = urllib.request.Request(url, headers=headers)
-    with urllib.request.urlopen(req) as response:
-        return int(response.headers['Content-Length'])
+def _get_file_size_and_version_of_remote_file(url: str) -> Tuple[int, Union[str, None]]:
+    # Only the headers are needed, so the body is not downloaded
+    with _http_session.get(url, stream=True) as response:
+        response.raise_for_status()
+        file_size = int(response.headers['Content-Length'])
+        file_version = response.headers.get('ETag', None) or response.headers.get('Last-Modified', None)
+        return file_size, file_version
+
+
+# The number of bytes requested when opening a remote file. Files up to this
+# size are downloaded in a single request.
+_remote_file_head_size = 64 * 1024
+
+
+def _download_file_head(url: str, num_bytes: int) -> Tuple[bytes, int, Union[str, None]]:
+    headers = {"Range": f"bytes=0-{num_bytes - 1}"}
+    response = _http_session.get(url, headers=headers)
+    response.raise_for_status()
+    buf = response.content
+    file_version = response.headers.get('ETag', None) or response.headers.get('Last-Modified', None)
+    if response.status_code != 206:
+        # The server ignored the range and sent the whole file
+        return buf, len(buf), file_version
+    # The total size is the part after the slash in "bytes 0-511/12345"
+    total_size = response.headers.get('Content-Range', '').rpartition('/')[2]
+    if total_size.isdigit():
+        return buf, int(total_size), file_version
+    file_size, file_version = _get_file_size_and_version_of_remote_file(url)  # pragma: no cover
+    return buf, file_size, file_version  # pragma: no cover
+
+
+# The rest of a remote file larger than this is downloaded as byte ranges of
+# this size in parallel
+_parallel_download_part_size = 8 * 1024 * 1024
+
+
+def _download_rest_of_file(url: str, file_size: int, head_buf: bytes) -> bytes:
+    start = len(head_buf)
+    if start >= file_size:
+        return head_buf
+    if file_size - start <= _parallel_download_part_size:
+        return head_buf + _download_file_byte_range(url, start, file_size)
+    part_size = _parallel_download_part_size
+    ranges = [(a, min(a + part_size, file_size)) for a in range(start, file_size, part_size)]
+    with ThreadPoolExecutor(max_workers=min(len(ranges), _max_download_workers)) as executor:
+        parts = list(executor.map(lambda r: _download_file_byte_range(url, r[0], r[1]), ranges))
+    return b"".join([head_buf] + parts)
 
 
 def _download_file_byte_range(url: str, start: int, end: int) -> bytes:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-        "Range": f"bytes={start}-{end - 1}"
-    }
-    req = urllib.request.Request(url, headers=headers)
-    with urllib.request.urlopen(req) as response:
-        return response.read()
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    response = _http_session.get(url, headers=headers)
+    response.raise_for_status()
+    return response.content
 
 
 empty_rfs = {
@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Union
 import h5py
 import zarr
 
@@ -15,7 +15,7 @@ class LindiH5pyGroup(h5py.Group):
     def __init__(self, _zarr_group: zarr.Group, _file: "LindiH5pyFile"):
         self._zarr_group = _zarr_group
         self._file = _file
-        self._readonly = _file.mode not in ['r+']
+        self._readonly = _file._readonly
 
         # In h5py, the id property is an object that exposes low-level
         # operations specific to the HDF5 library. LINDI aims to override the
@@ -28,6 +28,9 @@ class LindiH5pyGroup(h5py.Group):
         # should be overridden.
         self._id = f'{id(self._file)}/{self._zarr_group.name}'
 
+        # This is set on the first access of the attrs property
+        self._cached_attrs: Union[LindiH5pyAttributes, None] = None
+
         # The self._write object handles all the writing operations
         from .writers.LindiH5pyGroupWriter import LindiH5pyGroupWriter  # avoid circular import
         if self._readonly:
@@ -119,7 +122,11 @@ class LindiH5pyGroup(h5py.Group):
 
     @property
     def attrs(self):  # type: ignore
-        return LindiH5pyAttributes(self._zarr_group.attrs, readonly=self._file.mode == 'r')
+        # The mode of the file does not change, so the same wrapper can be
+        # returned every time
+        if self._cached_attrs is None:
+            self._cached_attrs = LindiH5pyAttributes(self._zarr_group.attrs, readonly=self._readonly)
+        return self._cached_attrs
 
     @property
     def ref(self):
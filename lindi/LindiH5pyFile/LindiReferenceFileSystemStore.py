@@ -1,14 +1,14 @@
-from typing import Literal, Dict, Union
+from typing import Literal, Dict, List, Tuple, Union
 import os
 import json
 import time
 import base64
 import numpy as np
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from zarr.storage import Store as ZarrStore
 
 from ..LocalCache.LocalCache import ChunkTooLargeError, LocalCache
-from ..tar.lindi_tar import LindiTarFile
+from ..tar.lindi_tar import LindiTarFile, _http_session, _max_download_workers
 
 
 class LindiReferenceFileSystemStore(ZarrStore):
@@ -124,6 +124,9 @@ class LindiReferenceFileSystemStore(ZarrStore):
 
         self.rfs = rfs
         self.mode = mode
+        # This is incremented whenever the refs are modified, so that the file
+        # can tell whether there is anything new to flush
+        self._version = 0
         self.local_cache = local_cache
         self._source_url_or_path = _source_url_or_path
         self._source_tar_file = _source_tar_file
@@ -144,7 +147,86 @@ class LindiReferenceFileSystemStore(ZarrStore):
 
         return val
 
+    def getitems(self, keys, *, contexts):
+        # This is called by zarr with all the chunk keys needed for a
+        # selection. The remote chunks are downloaded in parallel rather than
+        # one at a time. The local cache is only accessed from this thread
+        # because its sqlite connection cannot be shared between threads.
+        ret = {}
+        to_download = []
+        for key in keys:
+            if key not in self:
+                continue
+            x = self._resolve_ref(key)
+            if isinstance(x, bytes):
+                ret[key] = x
+                continue
+            url_or_path, offset, length = x
+            is_url = url_or_path.startswith(('http://', 'https://'))
+            if is_url and self.local_cache is not None:
+                val = self.local_cache.get_remote_chunk(url=url_or_path, offset=offset, size=length)
+                if val is not None:
+                    ret[key] = val
+                    continue
+            if is_url:
+                to_download.append((key, url_or_path, offset, length))
+            else:
+                ret[key] = _read_bytes_from_url_or_path(url_or_path, offset, length)
+        # Chunks that are close together in the same file are downloaded with
+        # a single range request
+        ranges = _coalesce_byte_ranges(to_download)
+        if len(ranges) == 1:
+            bufs = [_read_bytes_from_url_or_path(ranges[0].url, ranges[0].start, ranges[0].end - ranges[0].start)]
+        elif len(ranges) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(ranges), _max_download_workers)) as executor:
+                bufs = list(executor.map(
+                    lambda r: _read_bytes_from_url_or_path(r.url, r.start, r.end - r.start),
+                    ranges
+                ))
+        else:
+            bufs = []
+        for r, buf in zip(ranges, bufs):
+            for key, offset, length in r.chunks:
+                val = buf[offset - r.start:offset - r.start + length]
+                self._put_in_local_cache(key, r.url, offset, length, val)
+                ret[key] = val
+        for key, val in ret.items():
+            padded_size = _get_padded_size(self, key, val)
+            if padded_size is not None:
+                ret[key] = _pad_chunk(val, padded_size)
+        return ret
+
     def _get_helper(self, key: str):
+        x = self._resolve_ref(key)
+        if isinstance(x, bytes):
+            return x
+        url_or_path, offset, length = x
+        is_url = url_or_path.startswith(('http://', 'https://'))
+        if is_url:
+            if self.local_cache is not None:
+                val = self.local_cache.get_remote_chunk(url=url_or_path, offset=offset, size=length)
+                if val is not None:
+                    return val
+            return self._read_remote_chunk(key, url_or_path, offset, length)
+        else:
+            return _read_bytes_from_url_or_path(url_or_path, offset, length)
+
+    def _read_remote_chunk(self, key: str, url: str, offset: int, length: int):
+        val = _read_bytes_from_url_or_path(url, offset, length)
+        self._put_in_local_cache(key, url, offset, length, val)
+        return val
+
+    def _put_in_local_cache(self, key: str, url: str, offset: int, length: int, val: bytes):
+        if self.local_cache is not None:
+            try:
+                self.local_cache.put_remote_chunk(url=url, offset=offset, size=length, data=val)
+            except ChunkTooLargeError:
+                print(f'Warning: unable to cache chunk of size {length} on LocalCache (key: {key})')
+
+    def _resolve_ref(self, key: str) -> Union[bytes, Tuple[str, int, int]]:
+        """Returns the content for the key if it is stored inline in the
+        reference file system, or otherwise the (url_or_path, offset, length)
+        where the content can be read."""
         if key not in self.rfs["refs"]:
             raise KeyError(key)
         x = self.rfs["refs"][key]
@@ -164,7 +246,7 @@ class LindiReferenceFileSystemStore(ZarrStore):
             if '{{' in url_or_path and '}}' in url_or_path and 'templates' in self.rfs:
                 for k, v in self.rfs["templates"].items():
                     url_or_path = url_or_path.replace("{{" + k + "}}", v)
-            is_url = url_or_path.startswith('http://') or url_or_path.startswith('https://')
+            is_url = url_or_path.startswith(('http://', 'https://'))
             if url_or_path.startswith('./'):
                 if self._source_url_or_path is None:
                     raise Exception(f"Cannot resolve relative path {url_or_path} without source file path")
@@ -191,20 +273,7 @@ class LindiReferenceFileSystemStore(ZarrStore):
                         source_file_parent_dir = '/'.join(self._source_url_or_path.split('/')[:-1])
                         abs_path = source_file_parent_dir + '/' + url_or_path[2:]
                         url_or_path = abs_path
-            if is_url:
-                if self.local_cache is not None:
-                    x = self.local_cache.get_remote_chunk(url=url_or_path, offset=offset, size=length)
-                    if x is not None:
-                        return x
-                val = _read_bytes_from_url_or_path(url_or_path, offset, length)
-                if self.local_cache is not None:
-                    try:
-                        self.local_cache.put_remote_chunk(url=url_or_path, offset=offset, size=length, data=val)
-                    except ChunkTooLargeError:
-                        print(f'Warning: unable to cache chunk of size {length} on LocalCache (key: {key})')
-            else:
-                val = _read_bytes_from_url_or_path(url_or_path, offset, length)
-            return val
+            return url_or_path, offset, length
         else:
             # should not happen given checks in __init__, but self.rfs is mutable
             # and contains mutable lists
@@ -224,9 +293,11 @@ class LindiReferenceFileSystemStore(ZarrStore):
             # if that fails, base64 encode it
             value2 = "base64:" + base64.b64encode(value).decode("ascii")
         self.rfs["refs"][key] = value2
+        self._version += 1
 
     def __delitem__(self, key: str):
         del self.rfs["refs"][key]
+        self._version += 1
 
     def __iter__(self):
         return iter(self.rfs["refs"])
@@ -256,9 +327,13 @@ class LindiReferenceFileSystemStore(ZarrStore):
         # important to use the LindiReferenceFileSystemStore here because then we
         # can resolve any base64 encoded values, etc when converting them to dicts
         store = LindiReferenceFileSystemStore(rfs)
-        for k, v in rfs['refs'].items():
-            if k.endswith('.zattrs') or k.endswith('.zgroup') or k.endswith('.zarray') or k.endswith('zarr.json'):  # note: zarr.json is for zarr v3
-                rfs['refs'][k] = json.loads(store[k].decode('utf-8'))
+        refs = rfs['refs']
+        for k, v in refs.items():
+            if k.endswith(('.zattrs', '.zgroup', '.zarray', 'zarr.json')):  # note: zarr.json is for zarr v3
+                if isinstance(v, dict):
+                    # already in the desired form, no need to encode and decode
+                    continue
+                refs[k] = json.loads(store[k].decode('utf-8'))
 
     @staticmethod
     def use_templates_in_rfs(rfs: dict) -> None:
@@ -269,8 +344,12 @@ class LindiReferenceFileSystemStore(ZarrStore):
         strings are of the form "{{u1}}", "{{u2}}", etc.
         """
         url_counts: Dict[str, int] = {}
-        for k, v in rfs['refs'].items():
+        # Keep the list refs so that the second pass below does not need to
+        # go through all the refs again
+        list_refs = []
+        for v in rfs['refs'].values():
             if isinstance(v, list):
+                list_refs.append(v)
                 url = v[0]
                 if '{{' not in url:
                     url_counts[url] = url_counts.get(url, 0) + 1
@@ -289,11 +368,11 @@ class LindiReferenceFileSystemStore(ZarrStore):
             template_names_for_urls[url] = f'u{i}'
         if new_templates:
             rfs['templates'] = new_templates
-        for k, v in rfs['refs'].items():
-            if isinstance(v, list):
-                url = v[0]
-                if url in template_names_for_urls:
-                    v[0] = '{{' + template_names_for_urls[url] + '}}'
+        template_strings_for_urls = {url: '{{' + name + '}}' for url, name in template_names_for_urls.items()}
+        for v in list_refs:
+            template_string = template_strings_for_urls.get(v[0], None)
+            if template_string is not None:
+                v[0] = template_string
 
     @staticmethod
     def remove_templates_in_rfs(rfs: dict) -> None:
@@ -312,12 +391,49 @@ class LindiReferenceFileSystemStore(ZarrStore):
         rfs['templates'] = {}
 
 
+# Remote chunks that are separated by at most this many bytes are downloaded
+# together, as long as the combined request is not larger than the max size
+_max_coalesce_gap = 256 * 1024
+_max_coalesced_size = 16 * 1024 * 1024
+
+
+class _CoalescedByteRange:
+    __slots__ = ('url', 'start', 'end', 'chunks')
+
+    def __init__(self, url: str, start: int, end: int, chunks: List[Tuple[str, int, int]]):
+        self.url = url
+        self.start = start
+        self.end = end
+        self.chunks = chunks  # list of (key, offset, length)
+
+
+def _coalesce_byte_ranges(to_download: List[Tuple[str, str, int, int]]) -> List[_CoalescedByteRange]:
+    """Group the (key, url, offset, length) chunk reads into byte ranges of
+    the same url that can be downloaded with a single request."""
+    by_url: Dict[str, List[Tuple[int, int, str]]] = {}
+    for key, url, offset, length in to_download:
+        by_url.setdefault(url, []).append((offset, length, key))
+    ret: List[_CoalescedByteRange] = []
+    for url, chunks in by_url.items():
+        chunks.sort()
+        current: Union[_CoalescedByteRange, None] = None
+        for offset, length, key in chunks:
+            end = offset + length
+            if current is not None and offset - current.end <= _max_coalesce_gap and max(current.end, end) - current.start <= _max_coalesced_size:
+                current.end = max(current.end, end)
+                current.chunks.append((key, offset, length))
+            else:
+                current = _CoalescedByteRange(url, offset, end, [(key, offset, length)])
+                ret.append(current)
+    return ret
+
+
 def _read_bytes_from_url_or_path(url_or_path: str, offset: int, length: int):
     """
     Read a range of bytes from a URL.
     """
     from ..LindiRemfile.LindiRemfile import _resolve_url
-    if url_or_path.startswith('http://') or url_or_path.startswith('https://'):
+    if url_or_path.startswith(('http://', 'https://')):
         num_retries = 8
         for try_num in range(num_retries):
             try:
@@ -325,11 +441,8 @@ def _read_bytes_from_url_or_path(url_or_path: str, offset: int, length: int):
                 range_start = offset
                 range_end = offset + length - 1
                 range_header = f"bytes={range_start}-{range_end}"
-                headers = {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-                    "Range": range_header
-                }
-                response = requests.get(url_resolved, headers=headers)
+                headers = {"Range": range_header}
+                response = _http_session.get(url_resolved, headers=headers)
                 response.raise_for_status()
                 return response.content
             except Exception as e:
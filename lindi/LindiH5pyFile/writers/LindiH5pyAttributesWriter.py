@@ -13,3 +13,10 @@ class LindiH5pyAttributesWriter:
         if self.p._readonly:
             raise KeyError("Cannot set attributes on read-only object")
         self.p._attrs[key] = h5_to_zarr_attr(value, h5f=None)
+
+    def update(self, values: dict):
+        from ...conversion.attr_conversion import h5_to_zarr_attr  # avoid circular import
+        if self.p._readonly:
+            raise KeyError("Cannot set attributes on read-only object")
+        # A single update of the zarr attributes writes .zattrs only once
+        self.p._attrs.update({k: h5_to_zarr_attr(v, h5f=None) for k, v in values.items()})
@@ -1,6 +1,21 @@
 import numpy as np
+import h5py
 
 
 def _is_numeric_dtype(dtype: np.dtype) -> bool:
     """Return True if the dtype is a numeric dtype."""
     return np.issubdtype(dtype, np.number)
+
+
+def _read_h5_dataset(h5_dataset: h5py.Dataset) -> np.ndarray:
+    """Read the entire contents of an h5py dataset into a numpy array.
+
+    For compound and object datasets we preallocate the output array and use
+    read_direct, which avoids the overhead of h5py's high-level slicing.
+    """
+    if h5_dataset.ndim > 0 and h5_dataset.dtype.kind in ['V', 'O']:
+        ret = np.empty(h5_dataset.shape, dtype=h5_dataset.dtype)
+        if ret.size > 0:
+            h5_dataset.read_direct(ret)
+        return ret
+    return h5_dataset[...]
@@ -5,9 +5,13 @@ import numcodecs
 from numcodecs.abc import Codec
 import h5py
 import zarr
-from .h5_ref_to_zarr_attr import h5_ref_to_zarr_attr
+from .h5_ref_to_zarr_attr import h5_refs_to_zarr_attrs
 from .attr_conversion import h5_to_zarr_attr
-from ._util import _is_numeric_dtype
+from ._util import _is_numeric_dtype, _read_h5_dataset
+
+# The JSON codec is stateless, so a single instance is shared by all object
+# and compound datasets
+_json_codec = numcodecs.JSON()
 
 
 def create_zarr_dataset_from_h5_data(
@@ -142,18 +146,17 @@ def create_zarr_dataset_from_h5_data(
                 raise Exception('zarr_compressor is not supported for object datasets')
             if h5_data is not None:
                 if isinstance(h5_data, h5py.Dataset):
-                    h5_data = h5_data[:]
+                    h5_data = _read_h5_dataset(h5_data)
                 zarr_data = h5_object_data_to_zarr_data(h5_data, h5f=h5f, label=label)
             else:
                 zarr_data = None
-            object_codec = numcodecs.JSON()
             return zarr_parent_group.create_dataset(
                 name,
                 shape=h5_shape,
                 chunks=h5_chunks,
                 dtype=h5_dtype,
                 data=zarr_data,
-                object_codec=object_codec
+                object_codec=_json_codec
             )
         elif h5_dtype.kind == 'S':  # byte string
             if zarr_compressor != 'default' and zarr_compressor is not None:
@@ -176,12 +179,25 @@ def create_zarr_dataset_from_h5_data(
                 raise Exception('zarr_compressor is not supported for compound datasets')
             if h5_data is None:
                 raise Exception(f'Data must be provided when converting compound dataset {label}')
+            if isinstance(h5_data, h5py.Dataset):
+                h5_data = _read_h5_dataset(h5_data)
             h5_data_1d_view = h5_data.ravel()
             zarr_data = np.empty(h5_shape, dtype='object')
             zarr_data_1d_view = zarr_data.ravel()
+            # The reference fields are encoded a whole column at a time so that
+            # each referenced object only needs to be looked up once
+            encoded_ref_columns = {
+                field_name: _encode_references(
+                    h5_data_1d_view[field_name],
+                    label=f'{label}.{field_name}',
+                    h5f=h5f
+                )
+                for field_name in h5_dtype.names
+                if h5py.check_ref_dtype(h5_dtype[field_name]) is not None
+            }
             for i in range(len(h5_data_1d_view)):
                 elmt = tuple([
-                    _make_json_serializable(
+                    encoded_ref_columns[field_name][i] if field_name in encoded_ref_columns else _make_json_serializable(
                         h5_data_1d_view[i][field_name],
                         h5_dtype[field_name],
                         label=f'{label}[{i}].{field_name}',
@@ -196,7 +212,7 @@ def create_zarr_dataset_from_h5_data(
                 chunks=h5_chunks,
                 dtype='object',
                 data=zarr_data,
-                object_codec=numcodecs.JSON()
+                object_codec=_json_codec
             )
             compound_dtype = []
             for name in h5_dtype.names:
@@ -212,6 +228,8 @@ def create_zarr_dataset_from_h5_data(
 
 @dataclass
 class CreateZarrDatasetInfo:
+    # dataclass(slots=True) requires Python 3.10
+    __slots__ = ('shape', 'dtype', 'fill_value', 'scalar', 'compound_dtype')
     shape: Tuple
     dtype: Any
     fill_value: Any
@@ -243,6 +261,8 @@ def h5_object_data_to_zarr_data(h5_data: Union[np.ndarray, list], *, h5f: Union[
     zarr_data = np.empty(h5_data.shape, dtype='object')
     h5_data_1d_view = h5_data.ravel()
     zarr_data_1d_view = zarr_data.ravel()
+    # Indices of the h5py references, which are encoded together at the end
+    h5_ref_indices: List[int] = []
     for i, val in enumerate(h5_data_1d_view):
         if isinstance(val, bytes):
             zarr_data_1d_view[i] = val.decode()
@@ -255,12 +275,43 @@ def h5_object_data_to_zarr_data(h5_data: Union[np.ndarray, list], *, h5f: Union[
         elif isinstance(val, h5py.Reference):
             if h5f is None:
                 raise Exception(f'h5f cannot be None when converting h5py.Reference to zarr attribute at {label}')
-            zarr_data_1d_view[i] = h5_ref_to_zarr_attr(val, h5f=h5f)
+            h5_ref_indices.append(i)
         else:
             raise Exception(f'Cannot handle value of type {type(val)} in dataset {label} with dtype {h5_data.dtype} and shape {h5_data.shape}')
+    if h5_ref_indices:
+        assert h5f is not None
+        encoded_refs = h5_refs_to_zarr_attrs([h5_data_1d_view[i] for i in h5_ref_indices], h5f=h5f)
+        for i, encoded_ref in zip(h5_ref_indices, encoded_refs):
+            zarr_data_1d_view[i] = encoded_ref
     return zarr_data
 
 
+def _encode_references(refs: Any, *, label: str, h5f: Union[h5py.File, None]) -> List[dict]:
+    """Encode a sequence of references in the format that zarr can accept.
+
+    See h5_ref_to_zarr_attr() for the encoding of references.
+    """
+    from ..LindiH5pyFile.LindiH5pyReference import LindiH5pyReference  # Avoid circular import
+    ret: List[Any] = [None] * len(refs)
+    h5_ref_indices: List[int] = []
+    for i, ref in enumerate(refs):
+        if isinstance(ref, LindiH5pyReference):
+            ret[i] = {
+                '_REFERENCE': ref._obj
+            }
+        elif isinstance(ref, h5py.Reference):
+            h5_ref_indices.append(i)
+        else:
+            raise Exception(f'Unexpected type for reference at {label}[{i}]: {type(ref)}')
+    if h5_ref_indices:
+        if h5f is None:
+            raise Exception(f'h5f cannot be None when converting h5py.Reference to zarr attribute at {label}')
+        encoded_refs = h5_refs_to_zarr_attrs([refs[i] for i in h5_ref_indices], h5f=h5f)
+        for i, encoded_ref in zip(h5_ref_indices, encoded_refs):
+            ret[i] = encoded_ref
+    return ret
+
+
 def _get_default_chunks(shape: Tuple, dtype: Any) -> Tuple:
     dtype_size = np.dtype(dtype).itemsize
     shape_prod_0 = np.prod(shape[1:])
@@ -7,21 +7,43 @@ def decode_references(x: Any):
 
     See h5_ref_to_zarr_attr() for the encoding of references.
     """
+    # Fast path for the common case of numeric data, which cannot contain
+    # references
+    if isinstance(x, np.ndarray):
+        if x.dtype.kind != 'O':
+            return x
+    elif isinstance(x, (int, float, str, bytes, np.generic)):
+        return x
     from ..LindiH5pyFile.LindiH5pyReference import LindiH5pyReference  # Avoid circular import
-    if isinstance(x, dict):
-        # x should only be a dict when x represents a converted reference
-        if '_REFERENCE' in x:
-            return LindiH5pyReference(x['_REFERENCE'])
-        else:  # pragma: no cover
-            raise Exception(f"Unexpected dict in selection: {x}")
-    elif isinstance(x, list):
-        # Replace any references in the list with the resolved ref in-place
-        for i, v in enumerate(x):
-            x[i] = decode_references(v)
-    elif isinstance(x, np.ndarray):
-        if x.dtype == object or x.dtype is None:
+
+    # Nested lists and object arrays are walked with an explicit stack rather
+    # than by recursion, so deeply nested structures do not hit the recursion
+    # limit
+    stack = []
+
+    def decode_element(v: Any):
+        if isinstance(v, dict):
+            # v should only be a dict when v represents a converted reference
+            if '_REFERENCE' in v:
+                return LindiH5pyReference(v['_REFERENCE'])
+            else:  # pragma: no cover
+                raise Exception(f"Unexpected dict in selection: {v}")
+        if isinstance(v, list) or (isinstance(v, np.ndarray) and v.dtype == object):
+            stack.append(v)
+        return v
+
+    x = decode_element(x)
+    if stack:
+        # The ufunc applies decode_element to each element of an object array
+        # without a Python-level loop over the indices
+        decode_element_ufunc = np.frompyfunc(decode_element, 1, 1)
+    while stack:
+        y = stack.pop()
+        if isinstance(y, list):
+            # Replace any references in the list with the resolved ref in-place
+            for i, v in enumerate(y):
+                y[i] = decode_element(v)
+        elif y.size > 0:
             # Replace any references in the object array with the resolved ref in-place
-            view_1d = x.reshape(-1)
-            for i in range(len(view_1d)):
-                view_1d[i] = decode_references(view_1d[i])
+            y[...] = decode_element_ufunc(y)
     return x
@@ -1,3 +1,4 @@
+from typing import List, Dict, Any
 import h5py
 
 
@@ -34,28 +35,45 @@ def h5_ref_to_zarr_attr(ref: h5py.Reference, *, h5f: h5py.File):
     another field in the value containing the region info. See
     https://hdmf-zarr.readthedocs.io/en/latest/storage.html#sec-zarr-storage-references-region
     """
-    dref_obj = h5f[ref]
-    deref_objname = dref_obj.name
+    return h5_refs_to_zarr_attrs([ref], h5f=h5f)[0]
 
-    object_id = dref_obj.attrs.get("object_id", None)
 
+def h5_refs_to_zarr_attrs(refs: List[h5py.Reference], *, h5f: h5py.File) -> List[dict]:
+    """Convert/encode a list of h5py references. See h5_ref_to_zarr_attr().
+
+    This is more efficient than calling h5_ref_to_zarr_attr() for each
+    reference because the file object_id is only read once, and the name and
+    object_id of each target object are only looked up once, even if many of
+    the references point to the same object.
+    """
     # Here we assume that the file has a top-level attribute called "object_id".
     # This will be the case for files created by the LindiH5ZarrStore class.
-    file_object_id = h5f.attrs.get("object_id", None)
+    file_object_id = _decode_if_bytes(h5f.attrs.get("object_id", None))
 
-    # See https://hdmf-zarr.readthedocs.io/en/latest/storage.html#storing-object-references-in-attributes
-    value = {
-        "object_id": object_id,
-        "path": deref_objname,
-        "source": ".",  # Are we always going to use the top-level object as the source?
-        "source_object_id": file_object_id,
-    }
+    # The dereferenced objects compare equal (and hash the same) when they
+    # point to the same object in the file
+    values_by_target: Dict[Any, dict] = {}
+    ret = []
+    for ref in refs:
+        dref_obj = h5f[ref]
+        value = values_by_target.get(dref_obj.id, None)
+        if value is None:
+            # See https://hdmf-zarr.readthedocs.io/en/latest/storage.html#storing-object-references-in-attributes
+            value = {
+                "object_id": _decode_if_bytes(dref_obj.attrs.get("object_id", None)),
+                "path": _decode_if_bytes(dref_obj.name),
+                "source": ".",  # Are we always going to use the top-level object as the source?
+                "source_object_id": file_object_id,
+            }
+            values_by_target[dref_obj.id] = value
+        ret.append({
+            "_REFERENCE": value
+        })
+    return ret
 
-    # We need this to be json serializable
-    for k, v in value.items():
-        if isinstance(v, bytes):
-            value[k] = v.decode('utf-8')
 
-    return {
-        "_REFERENCE": value
-    }
+def _decode_if_bytes(v):
+    # We need this to be json serializable
+    if isinstance(v, bytes):
+        return v.decode('utf-8')
+    return v
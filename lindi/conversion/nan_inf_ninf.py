@@ -1,19 +1,48 @@
 import numpy as np
 
 
+_special_float_strings = ('NaN', 'Infinity', '-Infinity')
+
+
 def decode_nan_inf_ninf(val):
+    # Most attributes do not contain any special float values, so we avoid
+    # rebuilding the nested structure in that case
+    if not _needs_decode(val):
+        return val
+    return _decode_nan_inf_ninf(val)
+
+
+def _decode_nan_inf_ninf(val):
     if isinstance(val, list):
-        return [decode_nan_inf_ninf(v) for v in val]
+        return [_decode_nan_inf_ninf(v) for v in val]
     elif isinstance(val, dict):
-        return {k: decode_nan_inf_ninf(v) for k, v in val.items()}
-    elif val == 'NaN':
-        return float('nan')
-    elif val == 'Infinity':
-        return float('inf')
-    elif val == '-Infinity':
-        return float('-inf')
-    else:
-        return val
+        return {k: _decode_nan_inf_ninf(v) for k, v in val.items()}
+    elif val.__class__ is str:
+        if val == 'NaN':
+            return float('nan')
+        elif val == 'Infinity':
+            return float('inf')
+        elif val == '-Infinity':
+            return float('-inf')
+    return val
+
+
+def _needs_decode(val) -> bool:
+    """Return True if val contains any of the special float strings.
+
+    This uses an explicit stack rather than recursion and returns as soon as
+    a special string is found.
+    """
+    stack = [val]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, list):
+            stack.extend(x)
+        elif isinstance(x, dict):
+            stack.extend(x.values())
+        elif x.__class__ is str and x in _special_float_strings:
+            return True
+    return False
 
 
 def encode_nan_inf_ninf(val):
@@ -85,3 +85,4 @@ class LindiTarStore(ZarrStore):
             offset,
             size
         ]
+        self._base_store._version += 1
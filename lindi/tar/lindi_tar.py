@@ -1,7 +1,8 @@
 import os
 import json
 import random
-import urllib.request
+import requests
+from requests.adapters import HTTPAdapter
 from .create_tar_header import create_tar_header
 
 
@@ -402,20 +403,48 @@ class LindiTarFile:
         self._index_has_changed = False
 
 
+def _get_max_download_workers() -> int:
+    # A bad value of the environment variable must not make importing lindi
+    # fail, so the default is used instead
+    default = 16
+    value = os.environ.get('LINDI_FETCH_CONCURRENCY', None)
+    if value is None:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f'Invalid value for LINDI_FETCH_CONCURRENCY: {value!r}, using {default}')
+        return default
+
+
+# The maximum number of remote chunks that are downloaded at the same time.
+# This can be tuned with the LINDI_FETCH_CONCURRENCY environment variable.
+_max_download_workers = _get_max_download_workers()
+
+# A single session is shared by all the HTTP requests of lindi (remote tar
+# files, reference file system chunks and remote lindi files) so that
+# connections (including the TLS handshake) are reused between requests to the
+# same host.
+# The connection pool is large enough for all the parallel downloads.
+# The User-Agent is set once on the session rather than in each request.
+_http_session = requests.Session()
+_http_session.headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+_http_session.mount('http://', HTTPAdapter(pool_maxsize=_max_download_workers))
+_http_session.mount('https://', HTTPAdapter(pool_maxsize=_max_download_workers))
+
+
 def _download_file_byte_range(url: str, start: int, end: int) -> bytes:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3",
-        "Range": f"bytes={start}-{end - 1}"
-    }
-    req = urllib.request.Request(url, headers=headers)
-    with urllib.request.urlopen(req) as response:
-        return response.read()
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    response = _http_session.get(url, headers=headers)
+    response.raise_for_status()
+    return response.content
 
 
 def _load_all_bytes_from_local_or_remote_file(path_or_url: str) -> bytes:
     if path_or_url.startswith("http://") or path_or_url.startswith("https://"):
-        with urllib.request.urlopen(path_or_url) as response:
-            return response.read()
+        response = _http_session.get(path_or_url)
+        response.raise_for_status()
+        return response.content
     else:
         with open(path_or_url, "rb") as f:
             return f.read()
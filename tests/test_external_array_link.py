@@ -1,8 +1,13 @@
 import tempfile
+import importlib
+from collections import OrderedDict
 import numpy as np
 import h5py
 import lindi
 
+# lindi.LindiH5pyDataset is the class, so the module is imported by name
+lindi_h5py_dataset_module = importlib.import_module('lindi.LindiH5pyFile.LindiH5pyDataset')
+
 
 def test_external_array_link():
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -23,5 +28,47 @@ def test_external_array_link():
             assert np.array_equal(X, X2)
 
 
+def test_external_hdf5_client_eviction(monkeypatch):
+    monkeypatch.setattr(lindi_h5py_dataset_module, '_max_external_hdf5_clients', 1)
+    monkeypatch.setattr(lindi_h5py_dataset_module, '_external_hdf5_clients', OrderedDict())
+    external_hdf5_clients = lindi_h5py_dataset_module._external_hdf5_clients
+    with tempfile.TemporaryDirectory() as tmpdir:
+        clients = []
+        arrays = []
+        for i in range(2):
+            filename = f"{tmpdir}/test{i}.h5"
+            X = np.random.randn(50, 12)
+            with h5py.File(filename, "w") as f:
+                f.create_dataset("dataset1", data=X, chunks=(10, 6))
+            with lindi.LindiH5ZarrStore.from_file(
+                filename,
+                url=filename,
+                opts=lindi.LindiH5ZarrStoreOpts(
+                    num_dataset_chunks_threshold=4
+                )
+            ) as store:
+                rfs = store.to_reference_file_system()
+            clients.append(lindi.LindiH5pyFile.from_reference_file_system(rfs))
+            arrays.append(X)
+        assert np.array_equal(clients[0]["dataset1"][:], arrays[0])  # type: ignore
+        assert list(external_hdf5_clients) == [(f"{tmpdir}/test0.h5", None)]
+        h5_client_0 = external_hdf5_clients[(f"{tmpdir}/test0.h5", None)][0]
+        assert np.array_equal(clients[1]["dataset1"][:], arrays[1])  # type: ignore
+        # the least recently used client is closed when the cache is full
+        assert list(external_hdf5_clients) == [(f"{tmpdir}/test1.h5", None)]
+        assert not h5_client_0.id.valid
+        # an evicted client is opened again when it is needed
+        assert np.array_equal(clients[0]["dataset1"][:], arrays[0])  # type: ignore
+        assert list(external_hdf5_clients) == [(f"{tmpdir}/test0.h5", None)]
+        # clients with a local cache are keyed on its directory
+        local_cache = lindi.LocalCache(cache_dir=f"{tmpdir}/local_cache")
+        client = lindi.LindiH5pyFile.from_reference_file_system(rfs, local_cache=local_cache)
+        assert np.array_equal(client["dataset1"][:], arrays[1])  # type: ignore
+        assert list(external_hdf5_clients) == [(f"{tmpdir}/test1.h5", f"{tmpdir}/local_cache")]
+        for (h5_client, ff) in external_hdf5_clients.values():
+            h5_client.close()
+            ff.close()
+
+
 if __name__ == "__main__":
     test_external_array_link()
@@ -1,9 +1,16 @@
 import tempfile
 import os
+import gc
+import importlib
 import pytest
+import numpy as np
 import h5py
 import lindi
-from .utils import assert_h5py_files_equal
+from .utils import assert_h5py_files_equal, serve_directory
+
+# lindi.LindiH5pyFile is the class, so the module is imported by name
+lindi_h5py_file_module = importlib.import_module('lindi.LindiH5pyFile.LindiH5pyFile')
+lindi_h5py_dataset_module = importlib.import_module('lindi.LindiH5pyFile.LindiH5pyDataset')
 
 
 def test_1():
@@ -55,6 +62,11 @@ def test_create_new_lindi_json_file():
             f.attrs['attr1'] = 'value1'
         with lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname) as f:
             assert f.attrs['attr1'] == 'value1'
+        # modifying the file should not return the previously loaded content
+        with lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname, mode='r+') as f:
+            f.attrs['attr1'] = 'value2'
+        with lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname) as f:
+            assert f.attrs['attr1'] == 'value2'
 
 
 @pytest.mark.network
@@ -67,6 +79,59 @@ def test_load_remote_lindi_json_file():
     assert_h5py_files_equal(f1, f2, skip_large_datasets=True)
 
 
+def _create_lindi_json_file_for_serving(fname: str, num_datasets: int):
+    with lindi.LindiH5pyFile.from_lindi_file(fname, mode='w') as f:
+        for i in range(num_datasets):
+            f.create_dataset(f'dataset{i}', data=[i, i + 1, i + 2])
+
+
+def test_load_served_lindi_json_file_smaller_than_head():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _create_lindi_json_file_for_serving(f'{tmpdir}/test.lindi.json', 2)
+        assert os.path.getsize(f'{tmpdir}/test.lindi.json') < lindi_h5py_file_module._remote_file_head_size
+        with serve_directory(tmpdir) as (base_url, requests_log):
+            f = lindi.LindiH5pyFile.from_lindi_file(f'{base_url}/test.lindi.json')
+            # the whole file comes with the first request
+            assert len(requests_log) == 1
+            assert f['dataset1'][()].tolist() == [1, 2, 3]  # type: ignore
+
+
+def test_load_served_lindi_json_file_in_parallel_parts(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = f'{tmpdir}/test.lindi.json'
+        _create_lindi_json_file_for_serving(fname, 20)
+        file_size = os.path.getsize(fname)
+        monkeypatch.setattr(lindi_h5py_file_module, '_remote_file_head_size', 1000)
+        monkeypatch.setattr(lindi_h5py_file_module, '_parallel_download_part_size', 1000)
+        with serve_directory(tmpdir) as (base_url, requests_log):
+            f = lindi.LindiH5pyFile.from_lindi_file(f'{base_url}/test.lindi.json')
+            # one request for the head, then one for each part of the rest
+            num_parts = (file_size - 1000 + 999) // 1000
+            assert num_parts > 1
+            assert len(requests_log) == 1 + num_parts
+            assert f['dataset19'][()].tolist() == [19, 20, 21]  # type: ignore
+            head_buf, size, _ = lindi_h5py_file_module._download_file_head(f'{base_url}/test.lindi.json', 1000)
+            assert size == file_size
+            buf = lindi_h5py_file_module._download_rest_of_file(f'{base_url}/test.lindi.json', size, head_buf)
+            with open(fname, 'rb') as f2:
+                assert buf == f2.read()
+
+
+def test_load_lindi_json_file_from_server_without_range_support():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = f'{tmpdir}/test.lindi.json'
+        _create_lindi_json_file_for_serving(fname, 2)
+        with serve_directory(tmpdir, support_range=False) as (base_url, requests_log):
+            head_buf, size, _ = lindi_h5py_file_module._download_file_head(f'{base_url}/test.lindi.json', 100)
+            # the server sends the whole file, which is then not downloaded again
+            assert size == os.path.getsize(fname)
+            assert len(head_buf) == size
+            assert lindi_h5py_file_module._download_rest_of_file(f'{base_url}/test.lindi.json', size, head_buf) == head_buf
+            assert len(requests_log) == 1
+            f = lindi.LindiH5pyFile.from_lindi_file(f'{base_url}/test.lindi.json')
+            assert f['dataset1'][()].tolist() == [1, 2, 3]  # type: ignore
+
+
 def test_fail_open_non_existing_file_for_reading():
     with tempfile.TemporaryDirectory() as tmpdir:
         with pytest.raises(FileNotFoundError):
@@ -109,6 +174,46 @@ def test_append_to_lindi_json_file():
             assert f.attrs['attr2'] == 2
 
 
+@pytest.mark.parametrize('ext', ['lindi.json', 'lindi.tar'])
+def test_flush_writes_changes_made_after_previous_flush(ext):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = f'{tmpdir}/test.{ext}'
+        with lindi.LindiH5pyFile.from_lindi_file(fname, mode='w') as f:
+            group1 = f.create_group('group1')
+            group1.create_dataset('dataset1', data=[1, 2, 3])
+            f.flush()
+            # copying a dataset only copies its refs
+            f.copy('group1/dataset1', f, 'dataset2')
+            f.flush()
+            # the file is not closed here, so each change is only in the
+            # file if the flush after it wrote it
+            with lindi.LindiH5pyFile.from_lindi_file(fname) as f2:
+                assert f2['dataset2'][()].tolist() == [1, 2, 3]  # type: ignore
+            f.attrs.update({'attr1': 'value1'})
+            f.flush()
+            with lindi.LindiH5pyFile.from_lindi_file(fname) as f2:
+                assert f2.attrs['attr1'] == 'value1'
+
+
+@pytest.mark.parametrize('ext', ['lindi.json', 'lindi.tar'])
+def test_flush_without_changes_does_not_write_file(ext):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fname = f'{tmpdir}/test.{ext}'
+        with lindi.LindiH5pyFile.from_lindi_file(fname, mode='w') as f:
+            f.create_group('group1')
+        with open(fname, 'rb') as f:
+            content = f.read()
+        # set the modification time into the past so that a write would be
+        # seen even on file systems with a coarse time resolution
+        os.utime(fname, ns=(0, 0))
+        with lindi.LindiH5pyFile.from_lindi_file(fname, mode='r+') as f:
+            assert 'group1' in f
+            f.flush()
+        assert os.stat(fname).st_mtime_ns == 0
+        with open(fname, 'rb') as f:
+            assert f.read() == content
+
+
 def test_rfs_for_lindi_tar_file():
     with tempfile.TemporaryDirectory() as tmpdir:
         lindi_tar_fname = f'{tmpdir}/test.lindi.tar'
@@ -233,6 +338,11 @@ def test_copy_lindi_to_lindi():
         assert 'group2' in f['group1']  # type: ignore
         assert 'group3' in f
         assert 'group2' in f['group3']  # type: ignore
+        assert 'group3/group2/dataset1' in f
+        assert '/group1/group2' in f
+        assert 'group1//group2' in f
+        assert 'group3//group2/dataset1/' in f
+        assert 'group1/group4' not in f
         assert f['group1'].attrs['attr1'] == 'value1'  # type: ignore
         assert f['group3'].attrs['attr1'] == 'value1'  # type: ignore
         assert f['group3']['group2'].attrs['attr2'] == 2  # type: ignore
@@ -241,6 +351,25 @@ def test_copy_lindi_to_lindi():
         assert ds.shape == (3,)
 
 
+def test_fail_copy_into_read_only_file():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lindi_json_fname = f'{tmpdir}/test.lindi.json'
+        with lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname, mode='w') as f:
+            f.create_group('group1')
+            f.create_dataset('dataset1', data=[1, 2, 3])
+        src = lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname)
+        dest = lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname)
+        with pytest.raises(ValueError):
+            src.copy('dataset1', dest, 'phantom')
+        with pytest.raises(ValueError):
+            src.copy('group1', dest['group1'], 'phantom')
+        # read-only files opened from the same path share their refs, so
+        # a copy must not show up when the file is opened again
+        f = lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname)
+        assert 'phantom' not in f
+        assert 'group1/phantom' not in f
+
+
 def test_copy_lindi_to_hdf5():
     with tempfile.TemporaryDirectory() as tmpdir:
         lindi_json_fname = f'{tmpdir}/test.lindi.json'
@@ -357,6 +486,142 @@ def test_create_dataset():
             assert ds.shape == (3,)
 
 
+def test_special_attributes_hidden():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_fname = f'{tmpdir}/test.h5'
+        with h5py.File(h5_fname, 'w') as h5f:
+            ds = h5f.create_dataset('scalar1', data=1)
+            ds.attrs['attr1'] = 'value1'
+        with lindi.LindiH5pyFile.from_hdf5_file(h5_fname, url=h5_fname) as f:
+            ds = f['scalar1']
+            assert isinstance(ds, lindi.LindiH5pyDataset)
+            # _SCALAR is present in the zarr attributes but should be hidden
+            assert '_SCALAR' in ds._zarr_array.attrs
+            assert '_SCALAR' not in ds.attrs
+            assert ds.attrs.get('_SCALAR') is None
+            assert list(ds.attrs) == ['attr1']
+            assert len(ds.attrs) == 1
+
+
+def test_parent_group_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(lindi_h5py_file_module, '_max_item_cache_entries', 2)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lindi_json_fname = f'{tmpdir}/test.lindi.json'
+        with lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname, mode='w') as f:
+            for i in range(3):
+                f.create_group(f'group{i}').create_dataset('dataset1', data=[i])
+        with lindi.LindiH5pyFile.from_lindi_file(lindi_json_fname) as f:
+            for i in range(3):
+                assert f[f'group{i}/dataset1'][()].tolist() == [i]  # type: ignore
+            # only the most recently used parent groups are kept
+            assert f._parent_group_cache is not None
+            assert list(f._parent_group_cache) == [('group1',), ('group2',)]
+
+
+def test_compound_and_object_datasets():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_fname = f'{tmpdir}/test.h5'
+        with h5py.File(h5_fname, 'w') as h5f:
+            group1 = h5f.create_group('group1')
+            group1.attrs['attr1'] = 'value1'
+            dt = np.dtype([('x', 'i4'), ('y', 'f8'), ('ref', h5py.special_dtype(ref=h5py.Reference))])
+            compound = h5f.create_dataset('compound1', shape=(3,), dtype=dt)
+            for i in range(3):
+                compound[i] = (i, i * 1.5, group1.ref)
+            h5f.create_dataset('strings1', data=['a', 'bb', 'ccc'], dtype=h5py.string_dtype())
+        with lindi.LindiH5pyFile.from_hdf5_file(h5_fname, url=h5_fname) as f:
+            ds = f['compound1']
+            assert isinstance(ds, lindi.LindiH5pyDataset)
+            # read-only files return the same object for the same path
+            assert f['compound1'] is ds
+            assert ds.dtype.names == ('x', 'y', 'ref')
+            assert ds['x'][()].tolist() == [0, 1, 2]
+            assert ds['y'][1] == 1.5
+            with pytest.raises(ValueError):
+                ds['z']
+            ref = ds['ref'][2]
+            assert isinstance(ref, lindi.LindiH5pyReference)
+            assert f[ref].attrs['attr1'] == 'value1'
+            # iterating reads the values of the field, which are then reused
+            assert list(ds['x']) == [0, 1, 2]
+            assert ds['y'][:].tolist() == [0, 1.5, 3]
+            assert all(isinstance(r, lindi.LindiH5pyReference) for r in ds['ref'])
+            strings = f['strings1']
+            assert isinstance(strings, lindi.LindiH5pyDataset)
+            assert strings[()].tolist() == ['a', 'bb', 'ccc']
+
+
+def test_compound_field_values_are_not_shared():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_fname = f'{tmpdir}/test.h5'
+        with h5py.File(h5_fname, 'w') as h5f:
+            dt = np.dtype([('x', 'i4'), ('y', 'f8')])
+            h5f.create_dataset('compound1', data=np.array([(i, i * 1.5) for i in range(5)], dtype=dt))
+        with lindi.LindiH5pyFile.from_hdf5_file(h5_fname, url=h5_fname) as f:
+            rfs = f.to_reference_file_system()
+        f = lindi.LindiH5pyFile.from_reference_file_system(rfs)
+        ds = f['compound1']
+        assert isinstance(ds, lindi.LindiH5pyDataset)
+        # iterating caches the values of the field
+        assert list(ds['x']) == [0, 1, 2, 3, 4]
+        ds_id = id(ds)
+        assert (ds_id, 0) in lindi_h5py_dataset_module._compound_columns
+        # changing a returned array does not change later reads
+        x = ds['x'][:]
+        x[0] = 777
+        assert ds['x'][:].tolist() == [0, 1, 2, 3, 4]
+        assert ds['x'][0] == 0
+        # the cached values are dropped when the dataset is garbage collected
+        del ds, f
+        gc.collect()
+        assert (ds_id, 0) not in lindi_h5py_dataset_module._compound_columns
+
+
+def test_compound_field_selections():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_fname = f'{tmpdir}/test.h5'
+        with h5py.File(h5_fname, 'w') as h5f:
+            dt = np.dtype([('x', 'i4'), ('y', 'f8')])
+            h5f.create_dataset('compound1', data=np.array([(i, i * 1.5) for i in range(5)], dtype=dt))
+        with lindi.LindiH5pyFile.from_hdf5_file(h5_fname, url=h5_fname) as f:
+            rfs = f.to_reference_file_system()
+        selections = [
+            (np.array([True, False, True, False, True]), [0, 2, 4]),
+            (slice(None, None, -1), [4, 3, 2, 1, 0]),
+            (slice(4, 0, -2), [4, 2]),
+            ([3, 1], [3, 1]),
+            (np.array([0, 4]), [0, 4]),
+            (slice(1, 3), [1, 2]),
+            ((Ellipsis,), [0, 1, 2, 3, 4]),
+            (-1, 4)
+        ]
+        for selection, expected in selections:
+            # before the values of the field are cached
+            f = lindi.LindiH5pyFile.from_reference_file_system(rfs)
+            ds = f['compound1']
+            assert isinstance(ds, lindi.LindiH5pyDataset)
+            assert np.array(ds['x'][selection]).tolist() == expected
+            # after the values of the field are cached
+            assert list(ds['x']) == [0, 1, 2, 3, 4]
+            assert np.array(ds['x'][selection]).tolist() == expected
+
+
+def test_compound_dataset_with_string_field():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_fname = f'{tmpdir}/test.h5'
+        with h5py.File(h5_fname, 'w') as h5f:
+            group1 = h5f.create_group('group1')
+            dt = np.dtype([('x', 'i4'), ('s', h5py.string_dtype()), ('ref', h5py.special_dtype(ref=h5py.Reference))])
+            h5f.create_dataset('compound1', data=np.array([(i, 'a' * (i + 1), group1.ref) for i in range(3)], dtype=dt))
+        with lindi.LindiH5pyFile.from_hdf5_file(h5_fname, url=h5_fname) as f:
+            ds = f['compound1']
+            assert isinstance(ds, lindi.LindiH5pyDataset)
+            assert list(ds['x']) == [0, 1, 2]
+            assert list(ds['s']) == ['a', 'aa', 'aaa']
+            assert ds['s'][1] == 'aa'
+            assert all(isinstance(r, lindi.LindiH5pyReference) for r in ds['ref'])
+
+
 def create_example_h5_file(fname):
     with h5py.File(fname, 'w') as f:
         f.attrs['attr1'] = 'value1'
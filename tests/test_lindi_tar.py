@@ -54,6 +54,19 @@ def test_write_growing_lindi_tar():
                     assert f.get_file_byte_range('lindi.json')
 
 
+def test_max_download_workers_from_environment(monkeypatch):
+    from lindi.tar.lindi_tar import _get_max_download_workers
+    monkeypatch.delenv('LINDI_FETCH_CONCURRENCY', raising=False)
+    assert _get_max_download_workers() == 16
+    monkeypatch.setenv('LINDI_FETCH_CONCURRENCY', '4')
+    assert _get_max_download_workers() == 4
+    monkeypatch.setenv('LINDI_FETCH_CONCURRENCY', '0')
+    assert _get_max_download_workers() == 1
+    # a bad value falls back to the default rather than failing
+    monkeypatch.setenv('LINDI_FETCH_CONCURRENCY', 'many')
+    assert _get_max_download_workers() == 16
+
+
 @pytest.mark.network
 def test_load_remote_lindi_tar():
     # This example will probably disappear in the future
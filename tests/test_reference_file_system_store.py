@@ -0,0 +1,94 @@
+import tempfile
+import numpy as np
+import h5py
+import lindi
+from lindi.LindiH5pyFile.LindiReferenceFileSystemStore import (
+    LindiReferenceFileSystemStore,
+    _coalesce_byte_ranges,
+    _max_coalesce_gap,
+    _max_coalesced_size
+)
+from .utils import serve_directory
+
+
+def _ranges_as_tuples(ranges):
+    return [(r.url, r.start, r.end, [c[0] for c in r.chunks]) for r in ranges]
+
+
+def test_coalesce_adjacent_byte_ranges():
+    url = 'https://example.org/file.h5'
+    ranges = _coalesce_byte_ranges([
+        ('b', url, 100, 100),
+        ('a', url, 0, 100),
+        ('c', url, 200, 50)
+    ])
+    assert _ranges_as_tuples(ranges) == [(url, 0, 250, ['a', 'b', 'c'])]
+
+
+def test_coalesce_byte_ranges_gap():
+    url = 'https://example.org/file.h5'
+    ranges = _coalesce_byte_ranges([
+        ('a', url, 0, 100),
+        ('b', url, 100 + _max_coalesce_gap, 100)
+    ])
+    assert _ranges_as_tuples(ranges) == [(url, 0, 200 + _max_coalesce_gap, ['a', 'b'])]
+    ranges = _coalesce_byte_ranges([
+        ('a', url, 0, 100),
+        ('b', url, 100 + _max_coalesce_gap + 1, 100)
+    ])
+    assert _ranges_as_tuples(ranges) == [
+        (url, 0, 100, ['a']),
+        (url, 100 + _max_coalesce_gap + 1, 200 + _max_coalesce_gap + 1, ['b'])
+    ]
+
+
+def test_coalesce_byte_ranges_max_size():
+    url = 'https://example.org/file.h5'
+    size = _max_coalesced_size // 2
+    ranges = _coalesce_byte_ranges([
+        ('a', url, 0, size),
+        ('b', url, size, size),
+        ('c', url, 2 * size, 1)
+    ])
+    assert _ranges_as_tuples(ranges) == [
+        (url, 0, 2 * size, ['a', 'b']),
+        (url, 2 * size, 2 * size + 1, ['c'])
+    ]
+
+
+def test_coalesce_byte_ranges_different_urls():
+    url1 = 'https://example.org/file1.h5'
+    url2 = 'https://example.org/file2.h5'
+    ranges = _coalesce_byte_ranges([
+        ('a', url1, 0, 100),
+        ('b', url2, 100, 100),
+        ('c', url1, 100, 100)
+    ])
+    assert _ranges_as_tuples(ranges) == [
+        (url1, 0, 200, ['a', 'c']),
+        (url2, 100, 200, ['b'])
+    ]
+
+
+def test_getitems_matches_getitem():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_fname = f'{tmpdir}/test.h5'
+        with h5py.File(h5_fname, 'w') as f:
+            f.create_dataset('X', data=np.arange(1000, dtype='int32'), chunks=(100,))
+        with serve_directory(tmpdir) as (base_url, requests_log):
+            url = f'{base_url}/test.h5'
+            with lindi.LindiH5pyFile.from_hdf5_file(h5_fname, url=url) as f:
+                rfs = f.to_reference_file_system()
+            # the chunks are references into the served file
+            assert list(rfs['templates'].values()) == [url]
+            assert all(isinstance(rfs['refs'][f'X/{i}'], list) for i in range(10))
+            store = LindiReferenceFileSystemStore(rfs, mode='r')
+            keys = [f'X/{i}' for i in range(10)] + ['X/does_not_exist']
+            requests_log.clear()
+            ret = store.getitems(keys, contexts={})
+            # the chunks are next to each other, so they are downloaded
+            # with a single request
+            assert len(requests_log) == 1
+            assert sorted(ret.keys()) == sorted(keys[:-1])
+            for key in keys[:-1]:
+                assert ret[key] == store[key]
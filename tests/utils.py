@@ -1,4 +1,9 @@
-from typing import Union
+from typing import List, Union
+import os
+import re
+import threading
+import contextlib
+import http.server
 import numpy as np
 import h5py
 from lindi.conversion.attr_conversion import h5_to_zarr_attr
@@ -92,3 +97,52 @@ def lists_are_equal(a, b):
                 continue
             return False
     return True
+
+
+@contextlib.contextmanager
+def serve_directory(dirname: str, *, support_range: bool = True):
+    """Serve the files of a directory over http on a local port, yielding the
+    base url and a list that records the Range header of each GET request
+    (None when there is no Range header). If support_range is False, the
+    server ignores the Range header and always sends the whole file."""
+    requests_log: List[Union[str, None]] = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self._send(include_body=False)
+
+        def do_GET(self):
+            requests_log.append(self.headers.get('Range', None))
+            self._send(include_body=True)
+
+        def _send(self, *, include_body: bool):
+            path = os.path.join(dirname, self.path.lstrip('/'))
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            with open(path, 'rb') as f:
+                data = f.read()
+            m = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+            if support_range and m:
+                start, end = int(m.group(1)), min(int(m.group(2)), len(data) - 1)
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+                data = data[start:end + 1]
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if include_body:
+                self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}', requests_log
+    finally:
+        server.shutdown()
+        server.server_close()